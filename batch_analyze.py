@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Batch Contract Analyzer
+
+✔ Walks a folder of contract PDFs / TXTs
+✔ Parses files in a process pool
+✔ Shares one loaded FAISS index across every analysis
+✔ Sends LLM calls through the rate-limited async Groq queue
+✔ Saves results with database_utils.save_analysis
+✔ Resumes where an interrupted run stopped
+
+Usage:
+    python batch_analyze.py data/contracts --workers 8 --concurrency 4
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.database_utils import save_analysis
+from utils.pdf_text import pool_context
+from utils.text_cache import load_contract_text
+from utils.vector_index import file_sha256
+
+CONTRACT_EXTENSIONS = (".pdf", ".txt")
+DEFAULT_STATE_FILE = os.path.join("data", "batch_state.jsonl")
+
+
+# =============================================================================
+#                           RESUME STATE
+# =============================================================================
+
+def load_completed(state_file, token_budget=None):
+    """
+    Map of file path -> sha256 for every contract a previous run finished.
+
+    A truncated analysis counts as finished only if it was run with at
+    least token_budget, so raising --token-budget re-analyzes it.
+    """
+    completed = {}
+    if not os.path.exists(state_file):
+        return completed
+    with open(state_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partial line from a crashed run
+            if entry.get("status") == "done" or (
+                    entry.get("status") == "truncated" and entry.get("token_budget", 0) >= (token_budget or 0)):
+                completed[entry["file"]] = entry["sha256"]
+            else:
+                completed.pop(entry["file"], None)
+    return completed
+
+
+def record_state(state_file, path, sha, status, error=None, token_budget=None):
+    entry = {"file": path, "sha256": sha, "status": status, "timestamp": int(time.time())}
+    if error:
+        entry["error"] = error
+    if token_budget:
+        entry["token_budget"] = token_budget
+    with open(state_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+# =============================================================================
+#                           DISCOVERY
+# =============================================================================
+
+def find_contracts(folder):
+    paths = []
+    for root, _, files in os.walk(folder):
+        for name in sorted(files):
+            if name.lower().endswith(CONTRACT_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+# =============================================================================
+#                           BATCH RUN
+# =============================================================================
+
+async def analyze_one(path, folder, sha, analyzer, pool, client, llm_semaphore, file_semaphore, state_file, summary):
+    name = os.path.relpath(path, folder)
+
+    # Bound how many parsed contracts sit in memory at once
+    async with file_semaphore:
+        try:
+            loop = asyncio.get_running_loop()
+            # Already one file per process, so each PDF is extracted serially
+            text = await loop.run_in_executor(pool, load_contract_text, path, 1)
+
+            result = await analyzer.aanalyze_contract(text, client=client, semaphore=llm_semaphore)
+            if result.get("error"):
+                raise RuntimeError(result["error"])
+            if result.get("incomplete"):
+                raise RuntimeError("some sections were rate-limited or returned unreadable output")
+
+            await asyncio.to_thread(save_analysis, name, path, {
+                "clauses": result.get("key_clauses", []),
+                "issues": result.get("compliance_issues", [])
+            })
+            if result.get("truncated"):
+                # Saved, but not as a full analysis: the later sections were never read
+                coverage = result["coverage"]
+                record_state(state_file, path, sha, "truncated", token_budget=analyzer.analysis_token_budget)
+                summary["truncated"] += 1
+                print(f"⚠️ {name}: {len(result.get('compliance_issues', []))} issues, token budget reached at "
+                      f"{coverage['sections_analyzed']}/{coverage['sections_total']} sections")
+            else:
+                record_state(state_file, path, sha, "done")
+                summary["done"] += 1
+                print(f"✅ {name}: {len(result.get('compliance_issues', []))} issues"
+                      f"{' (cached)' if result.get('cached') else ''}")
+
+        except Exception as e:
+            record_state(state_file, path, sha, "failed", str(e))
+            summary["failed"] += 1
+            print(f"❌ {name}: {e}")
+
+
+async def run_batch(folder, workers, concurrency, state_file, retry_all=False, token_budget=None):
+    paths = find_contracts(folder)
+    completed = {} if retry_all else load_completed(state_file, token_budget)
+
+    pending = []
+    for path in paths:
+        sha = file_sha256(path)
+        if completed.get(path) == sha:
+            continue
+        pending.append((path, sha))
+
+    print(f"📂 {len(paths)} contracts found, {len(paths) - len(pending)} already analyzed, {len(pending)} to go")
+    if not pending:
+        return {"done": 0, "truncated": 0, "failed": 0, "skipped": len(paths)}
+
+    # The spawned parser processes re-import this module; keep LangChain
+    # and the Groq client out of their start-up
+    from groq import AsyncGroq
+    from utils.rag_helper import RAGAnalyzer
+
+    # One analyzer = one FAISS index and one embedding model for the whole batch
+    analyzer = RAGAnalyzer()
+    analyzer.max_concurrent_requests = concurrency
+    if token_budget:
+        analyzer.analysis_token_budget = token_budget
+    analyzer.setup()
+
+    summary = {"done": 0, "truncated": 0, "failed": 0, "skipped": len(paths) - len(pending)}
+    llm_semaphore = asyncio.Semaphore(concurrency)
+    file_semaphore = asyncio.Semaphore(max(workers, concurrency) * 2)
+
+    # Not fork: this process already runs threads and holds the loaded models
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context()) as pool:
+        async with AsyncGroq(api_key=os.environ.get("GROQ_API_KEY")) as client:
+            await asyncio.gather(*[
+                analyze_one(path, folder, sha, analyzer, pool, client, llm_semaphore, file_semaphore, state_file, summary)
+                for path, sha in pending
+            ])
+
+    analyzer.cache.flush()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every contract in a folder")
+    parser.add_argument("folder", help="Folder to scan for .pdf / .txt contracts")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Processes used to parse files")
+    parser.add_argument("--concurrency", type=int, default=4, help="Groq requests in flight")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE, help="Resume log (JSON lines)")
+    parser.add_argument("--retry-all", action="store_true", help="Ignore the resume log and analyze everything")
+    parser.add_argument("--token-budget", type=int, default=None,
+                        help="Estimated tokens per contract; sections past it are skipped and flagged truncated")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.state) or ".", exist_ok=True)
+
+    start = time.time()
+    summary = asyncio.run(run_batch(args.folder, args.workers, args.concurrency, args.state, args.retry_all,
+                                    args.token_budget))
+    print(f"\n📊 Done in {time.time() - start:.1f}s — analyzed: {summary['done']}, "
+          f"truncated: {summary['truncated']}, failed: {summary['failed']}, skipped: {summary['skipped']}")
+    if summary["failed"]:
+        print("↻ Re-run the same command to retry the failed contracts.")
+    if summary["truncated"]:
+        print("↻ Re-run with a larger --token-budget to analyze the truncated contracts in full.")
+
+
+if __name__ == "__main__":
+    main()
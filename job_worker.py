@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Contract Analysis Job Worker
+
+✔ Claims queued jobs from the SQLite job table (utils/job_queue.py)
+✔ Runs load → analyze → index → save → notify outside the Streamlit script
+✔ Writes progress and a live preview back to the job row
+✔ Heartbeats so crashed jobs are requeued and Streamlit can see it is alive
+
+Streamlit starts one automatically; run more for extra throughput:
+    python job_worker.py
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+from utils.database_utils import save_analysis
+from utils.email_notifier import EmailNotifier
+from utils.job_queue import JobQueue, JOBS_DB_PATH
+
+HEARTBEAT_INTERVAL = 10
+PREVIEW_INTERVAL = 1.0  # Seconds between preview writes while tokens stream in
+
+
+def run_job(analyzer, queue, job):
+    """Analyze one contract, reporting progress through the job row"""
+    job_id = job["id"]
+    try:
+        queue.update(job_id, progress=10, message="📖 Loading contract...")
+        contract_text = analyzer.load_contract(job["file_path"])
+
+        queue.update(job_id, progress=30, message="🔍 Analyzing compliance...")
+        analysis_result = {"key_clauses": [], "compliance_issues": []}
+        streamed = ""
+        last_write = 0.0
+        for event in analyzer.analyze_contract_stream(contract_text):
+            if event["type"] == "token":
+                streamed += event["text"]
+                if time.time() - last_write >= PREVIEW_INTERVAL:
+                    queue.update(job_id, preview=streamed[-800:])
+                    last_write = time.time()
+            elif event["type"] == "section":
+                queue.update(job_id, progress=30 + int(40 * event["done"] / event["total"]),
+                             message=f"🔍 Analyzed section {event['done']} of {event['total']}...")
+            elif event["type"] == "result":
+                analysis_result = event["result"]
+
+        if analysis_result.get("error"):
+            raise RuntimeError(analysis_result["error"])
+
+        queue.update(job_id, progress=75, message="🗂️ Indexing contract for the chatbot...", preview="")
+        try:
+            analyzer.get_contract_index(contract_text)
+        except Exception as e:
+            print(f"⚠️ Contract index not built for {job['filename']}: {e}")
+
+        queue.update(job_id, progress=85, message="💾 Saving results...")
+        save_analysis(job["filename"], job["file_path"], {
+            "clauses": analysis_result.get("key_clauses", []),
+            "issues": analysis_result.get("compliance_issues", [])
+        })
+
+        if job.get("notification_email"):
+            try:
+                email_notifier = EmailNotifier()
+                if email_notifier.is_email_enabled():
+                    email_notifier.send_notification_safe(job["notification_email"], job["filename"], analysis_result)
+            except Exception:
+                pass  # Email problems must not fail the analysis
+
+        if analysis_result.get("incomplete"):
+            # Keep what was analyzed, but make the gap visible in the job row
+            queue.complete(job_id, analysis_result,
+                           message="⚠️ Analysis incomplete: some sections were rate-limited or unreadable")
+            print(f"⚠️ {job['filename']}: incomplete, some sections were rate-limited or unreadable")
+        elif analysis_result.get("truncated"):
+            coverage = analysis_result["coverage"]
+            queue.complete(job_id, analysis_result,
+                           message=f"⚠️ Analysis truncated: token budget reached at "
+                                   f"{coverage['sections_analyzed']}/{coverage['sections_total']} sections")
+            print(f"⚠️ {job['filename']}: truncated at {coverage['sections_analyzed']}/{coverage['sections_total']} sections")
+        else:
+            queue.complete(job_id, analysis_result)
+            print(f"✅ {job['filename']}: {len(analysis_result.get('compliance_issues', []))} issues")
+
+    except Exception as e:
+        queue.fail(job_id, str(e))
+        print(f"❌ {job['filename']}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process contract analysis jobs")
+    parser.add_argument("--db", default=JOBS_DB_PATH, help="Job database")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between checks for new jobs")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    pid = os.getpid()
+    queue = JobQueue(args.db)
+    current = {"job_id": None}
+    stop = threading.Event()
+
+    # A broken LangChain install is a start-up failure like any other, so
+    # the import sits inside the try rather than at the top of the script
+    try:
+        from utils.rag_helper import RAGAnalyzer
+
+        # One analyzer = one FAISS index and one embedding model for every job
+        analyzer = RAGAnalyzer()
+        # Results reach disk as soon as they are cached; a killed worker loses nothing
+        analyzer.cache.write_through = True
+        analyzer.setup()
+    except Exception as e:
+        # Streamlit shows this error and stops respawning workers until it is cleared
+        queue.worker_failed(pid, f"Error initializing RAG system: {e}")
+        print(f"❌ Worker {pid} could not start: {e}")
+        sys.exit(1)
+
+    # Only a worker that is ready to take jobs heartbeats
+    queue.clear_worker_errors()
+    queue.heartbeat(pid)
+
+    # Heartbeat from a side thread so a long Groq call never looks like a crash
+    def heartbeat():
+        while not stop.is_set():
+            queue.heartbeat(pid, current["job_id"])
+            stop.wait(HEARTBEAT_INTERVAL)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    print(f"👷 Worker {pid} ready")
+
+    try:
+        while True:
+            requeued = queue.requeue_stale()
+            if requeued:
+                print(f"↻ Requeued {requeued} job(s) from a stopped worker")
+
+            job = queue.claim(pid)
+            if job is None:
+                if args.once:
+                    break
+                time.sleep(args.poll_interval)
+                continue
+
+            current["job_id"] = job["id"]
+            print(f"▶ {job['filename']}")
+            run_job(analyzer, queue, job)
+            current["job_id"] = None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        queue.unregister_worker(pid)
+        analyzer.cache.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,17 @@ from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from groq import Groq   # ✅ Use Groq for LLM
+from utils.vector_index import build_manifest, sync_faiss_index
 
 # ---------- 2️⃣ Load environment ----------
 load_dotenv()
 client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
 
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 200
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
 # ---------- 3️⃣ Load Compliance Dataset ----------
 def load_compliance_data(pdf_path):
     print("📄 Loading compliance dataset from PDF...")
@@ -22,23 +26,24 @@ def load_compliance_data(pdf_path):
 # ---------- 4️⃣ Split into Chunks ----------
 def split_documents(documents):
     print("✂️ Splitting documents into smaller chunks...")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     chunks = splitter.split_documents(documents)
     print(f"✅ Split into {len(chunks)} chunks")
     return chunks
 
-# ---------- 5️⃣ Create or Load FAISS Vector Store ----------
-def create_vector_store(chunks, db_path="faiss_index"):
-    if os.path.exists(db_path):
-        print(f"📂 Loading existing FAISS index from '{db_path}'...")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        return FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
-    
-    print("⚙️ Creating embeddings and FAISS vector store...")
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    vectorstore.save_local(db_path)
-    print(f"✅ Vector store saved at '{db_path}'")
+# ---------- 5️⃣ Create, Update or Load FAISS Vector Store ----------
+def create_vector_store(chunks, pdf_path="scraped_data.pdf", db_path="faiss_index"):
+    print(f"⚙️ Syncing FAISS vector store at '{db_path}'...")
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    manifest = build_manifest(pdf_path, CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_MODEL)
+    vectorstore, stats = sync_faiss_index(db_path, chunks, embeddings, manifest)
+
+    if stats["mode"] == "loaded":
+        print(f"📂 Loaded existing FAISS index from '{db_path}' (up to date)")
+    elif stats["mode"] == "incremental":
+        print(f"✅ Updated index: {stats['added']} chunks embedded, {stats['removed']} removed")
+    else:
+        print(f"✅ Vector store built with {stats['added']} chunks and saved at '{db_path}'")
     return vectorstore
 
 # ---------- 6️⃣ Load the Contract ----------
@@ -109,7 +114,7 @@ if __name__ == "__main__":
     # 1. Load and process compliance dataset
     documents = load_compliance_data(pdf_path)
     chunks = split_documents(documents)
-    vectorstore = create_vector_store(chunks)
+    vectorstore = create_vector_store(chunks, pdf_path=pdf_path)
 
     # 2. Load contract file
     contract_text = load_contract(contract_path)
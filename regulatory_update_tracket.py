@@ -9,11 +9,18 @@ Regulatory Update Tracker (PDF Only + Email Alerts)
 ✔ Writes clean updated PDFs
 ✔ Saves history
 ✔ Sends email notification
+✔ Amends whole contract folders concurrently (AMEND_WORKERS threads)
 """
 
 import os
+import re
 import json
 import time
+import threading
+import unicodedata
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
@@ -63,12 +70,6 @@ def send_email_notification(subject, body, attachment_path=None):
 #                           DEPENDENCIES
 # =============================================================================
 
-try:
-    import pypdf
-except:
-    print("ERROR: Install pypdf → pip install pypdf")
-    sys.exit(1)
-
 try:
     from reportlab.lib.pagesizes import letter
     from reportlab.pdfgen import canvas
@@ -77,12 +78,16 @@ except:
     sys.exit(1)
 
 try:
-    from sentence_transformers import SentenceTransformer
     import numpy as np
 except:
-    print("ERROR: Install sentence-transformers + numpy → pip install sentence-transformers numpy")
+    print("ERROR: Install numpy → pip install numpy")
     sys.exit(1)
 
+from utils.embedding_registry import get_registry
+from utils.embedding_store import get_embedding_store
+from utils.pdf_text import iter_paragraphs
+from utils.text_cache import read_pdf_pages, stream_pdf_pages
+
 
 # =============================================================================
 #                           PATHS
@@ -126,11 +131,13 @@ def save_prev_regulations(regs):
 # =============================================================================
 
 def read_pdf(path):
-    reader = pypdf.PdfReader(path)
-    text = []
-    for page in reader.pages:
-        text.append(page.extract_text() or "")
-    return "\n".join(text)
+    # Cached per file version; page-parallel for large PDFs, pages reassembled in order
+    return "\n".join(read_pdf_pages(path))
+
+
+def stream_pdf(path):
+    # Same pages as read_pdf, one at a time; memory stays flat on huge PDFs
+    return stream_pdf_pages(path)
 
 
 # =============================================================================
@@ -167,18 +174,94 @@ def save_text_as_pdf(text, out_path):
 #                           RISK DETECTION
 # =============================================================================
 
+SHINGLE_SIZE = 5  # Tokens per shingle; a clause's last shingle prefilters exact matches
+
+# The trailing word of a page (with any words hyphenated into it across
+# line breaks), plus a hyphen and whitespace if it may continue on the next page
+_PAGE_TAIL = re.compile(r"(?:[^\W_]*-[ \t]*\n\s*)*[^\W_]*-?\s*$")
+
+
+def normalize_tokens(text):
+    # NFKC + lowercase, words hyphenated across a line break re-joined, then
+    # word tokens only: whitespace, punctuation and hyphenation stop mattering
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"([^\W_])-[ \t]*\n\s*([^\W_])", r"\1\2", text)
+    return re.findall(r"[^\W_]+", text)
+
+
+def iter_normalized_tokens(pages):
+    # normalize_tokens over "\n".join(pages), a page at a time
+    carry = ""
+    for page in pages:
+        text = carry + "\n" + page if carry else page
+        cut = _PAGE_TAIL.search(text).start()
+        carry = text[cut:]
+        yield from normalize_tokens(text[:cut])
+    if carry:
+        yield from normalize_tokens(carry)
+
+
+class ShingleIndex:
+    """
+    Exact clause lookups over a normalized token stream.
+
+    Clauses are keyed by their last shingle, so only a clause whose final
+    shingle just went by has its whole token run compared. A clause is
+    present only if all of its tokens occur contiguously and in order.
+    """
+
+    def __init__(self, clauses, size=SHINGLE_SIZE):
+        self.found = set()
+        self._by_tail = {}
+        for tokens in clauses:
+            if tokens:
+                # Clauses shorter than a shingle are one shingle of their own length
+                clause = tuple(tokens)
+                self._by_tail.setdefault(clause[-size:], set()).add(clause)
+        self._sizes = sorted({len(tail) for tail in self._by_tail})
+        self._longest = max((len(c) for group in self._by_tail.values() for c in group), default=0)
+
+    def add_tokens(self, tokens):
+        # Each call is a separate token run; no clause matches across two runs
+        window = []
+        recent = deque(maxlen=self._longest)
+        shingle = self._sizes[-1] if self._sizes else 0
+        for token in tokens:
+            window.append(token)
+            recent.append(token)
+            if len(window) > shingle:
+                del window[0]
+            run = None
+            for n in self._sizes:
+                if len(window) < n:
+                    break
+                for clause in self._by_tail.get(tuple(window[-n:]), ()):
+                    if clause in self.found or len(clause) > len(recent):
+                        continue
+                    run = run or tuple(recent)
+                    if run[-len(clause):] == clause:
+                        self.found.add(clause)
+
+    def contains(self, tokens):
+        """True if the clause's tokens occur as one contiguous run"""
+        return not tokens or tuple(tokens) in self.found
+
+
 def check_risks(contract_text, regulations):
-    missing = []
-    lower = contract_text.lower()
+    return check_risks_stream([contract_text], regulations)
 
-    for reg in regulations:
-        clause = reg.get("required_clause", "").lower()
-        if clause in lower:
-            continue
 
-        missing.append(reg)
+def check_risks_stream(pages, regulations):
+    # One pass over the contract confirms every clause as an exact run of
+    # normalized tokens, tolerant to line breaks, spacing and hyphenation
+    clause_tokens = [normalize_tokens(reg.get("required_clause", "")) for reg in regulations]
+    index = ShingleIndex(clause_tokens)
+    index.add_tokens(iter_normalized_tokens(pages))
 
-    return missing
+    return [
+        reg for reg, tokens in zip(regulations, clause_tokens)
+        if not index.contains(tokens)
+    ]
 
 
 # =============================================================================
@@ -203,20 +286,54 @@ def detect_regulation_changes(prev, curr):
 #                           EMBEDDINGS
 # =============================================================================
 
+EMBED_MODEL_NAME = "BAAI/bge-small-en"
 EMBED_MODEL = None
+_EMBED_MODEL_LOCK = threading.Lock()
 
 
 def get_model():
+    # Shared through the registry so a Streamlit worker that also runs
+    # RAGAnalyzer keeps a single copy of the weights in single-model mode
     global EMBED_MODEL
-    if EMBED_MODEL is None:
-        print("Loading embedding model BAAI/bge-small-en …")
-        EMBED_MODEL = SentenceTransformer("BAAI/bge-small-en")
+    with _EMBED_MODEL_LOCK:
+        if EMBED_MODEL is None:
+            registry = get_registry()
+            print(f"Loading embedding model {registry.resolve(EMBED_MODEL_NAME)} …")
+            EMBED_MODEL = registry.acquire_sentence_transformer(EMBED_MODEL_NAME)
     return EMBED_MODEL
 
 
+EMBED_BATCH_SIZE = 64
+
+
+def _encode(texts):
+    return get_model().encode(texts, batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True)
+
+
 def embed(texts):
-    model = get_model()
-    return model.encode(texts, convert_to_numpy=True)
+    # Persistent per-model store: the model is only loaded and run for text
+    # it has never embedded before, e.g. a new or changed required_clause
+    store = get_embedding_store(get_registry().resolve(EMBED_MODEL_NAME))
+    return store.embed(list(texts), _encode)
+
+
+def warm_embeddings(texts):
+    # Store vectors for every unseen text in large encode calls, without
+    # gathering them; later embed() calls for these texts are lookups
+    store = get_embedding_store(get_registry().resolve(EMBED_MODEL_NAME))
+    return store.ensure(list(texts), _encode)
+
+
+def embed_batches(texts, batch_size=EMBED_BATCH_SIZE):
+    # Encode an iterable of texts lazily, yielding one batch of vectors at a time
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            yield embed(batch)
+            batch = []
+    if batch:
+        yield embed(batch)
 
 
 def cosine(a, b):
@@ -225,69 +342,214 @@ def cosine(a, b):
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
 
 
+def embed_normalized(texts):
+    # Unit-length rows, so cosine similarity is a plain dot product;
+    # zero vectors stay zero and score 0 like cosine() does
+    batches = list(embed_batches(texts))
+    if not batches:
+        return np.zeros((0, get_model().get_sentence_embedding_dimension()), dtype=np.float32)
+    vectors = np.vstack(batches).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def semantic_top_k(para_vecs, clause_vecs, k=1):
+    # One (paragraphs x clauses) matrix multiply, then the k best
+    # paragraphs per clause, best first: returns (clauses x k) indices
+    scores = para_vecs @ clause_vecs.T
+    k = min(k, scores.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=0)[:k].T
+    order = np.argsort(-np.take_along_axis(scores.T, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
 def best_semantic_index(paragraphs, clause):
-    em_paras = embed(paragraphs)
-    em_clause = embed([clause])[0]
+    if not paragraphs:
+        return -1
+    return int(semantic_top_k(embed_normalized(paragraphs), embed_normalized([clause]))[0, 0])
+
+# =============================================================================
+#                           KEYWORD MATCHING
+# =============================================================================
+
+class KeywordMatcher:
+    """All keywords occurring in a text, found in one regex pass."""
+
+    def __init__(self, keywords):
+        self.keywords = sorted({kw.lower() for kw in keywords if kw})
+        # An empty keyword is a substring of everything
+        self.match_all = any(not kw for kw in keywords)
+
+        # Longest first, so at each position the lookahead captures the
+        # longest keyword starting there
+        alternation = "|".join(re.escape(kw) for kw in sorted(self.keywords, key=len, reverse=True))
+        self.pattern = re.compile(f"(?=({alternation}))") if self.keywords else None
+
+        # Prefix closure: every keyword that is a prefix of the longest match
+        # also starts at that position
+        self.closure = {
+            kw: frozenset(other for other in self.keywords if kw.startswith(other))
+            for kw in self.keywords
+        }
+
+    def find(self, text):
+        """Set of lowercase keywords that are substrings of text (already lowercased)"""
+        hits = set()
+        if self.pattern is not None:
+            for m in self.pattern.finditer(text):
+                hits |= self.closure[m.group(1)]
+        if self.match_all:
+            hits.add("")
+        return hits
+
+
+@lru_cache(maxsize=8)
+def _keyword_matcher(keywords):
+    return KeywordMatcher(keywords)
+
+
+def keyword_matcher(regulations, field):
+    # Keyed by the keyword set itself, so it is rebuilt only when
+    # regulations.json changes
+    return _keyword_matcher(tuple(sorted({kw.lower() for reg in regulations for kw in reg.get(field, [])})))
 
-    sims = [cosine(p, em_clause) for p in em_paras]
-    return int(np.argmax(sims))
 
 # =============================================================================
 #                           AMENDMENT ENGINE
 # =============================================================================
 
-def apply_amendment(contract_file, reg_changes):
+def prepare_amendment(contract_file, reg_changes, regulations=None):
+    # Read the contract and drop outdated paragraphs. regulations is the
+    # full regulation set, so the keyword matchers are shared by every
+    # contract instead of rebuilt per subset of changes
     path = os.path.join(CONTRACTS_DIR, contract_file)
-    original = read_pdf(path)
-
-    paragraphs = [p.strip() for p in original.split("\n\n") if p.strip()]
+    paragraphs = list(iter_paragraphs(stream_pdf(path)))
     low = [p.lower() for p in paragraphs]
+    all_regs = list(regulations or []) + list(reg_changes)
 
     updated = False
     actions = []
 
     # ----------- REMOVE OLD CONTENT -----------
-    for reg in reg_changes:
-        for kw in reg.get("remove_keywords", []):
-            new_list = []
-            removed = False
-            for p, lp in zip(paragraphs, low):
-                if kw.lower() in lp:
-                    removed = True
-                    updated = True
-                    continue
-                new_list.append(p)
-            if removed:
-                actions.append(f"Removed outdated clause related to '{reg['title']}'")
-            paragraphs = new_list
-            low = [p.lower() for p in paragraphs]
+    # One matcher pass per paragraph; each removed paragraph is credited to
+    # the first (regulation, keyword) pair that hits it, as the old
+    # keyword-by-keyword loop did
+    remove_pairs = [(reg, kw.lower()) for reg in reg_changes for kw in reg.get("remove_keywords", [])]
+    if remove_pairs:
+        first_pair = {}
+        for i, (_, kw) in enumerate(remove_pairs):
+            first_pair.setdefault(kw, i)
+        matcher = keyword_matcher(all_regs, "remove_keywords")
+        credited = set()
+        kept = []
+        for p, lp in zip(paragraphs, low):
+            pairs = [first_pair[kw] for kw in matcher.find(lp) if kw in first_pair]
+            if pairs:
+                credited.add(min(pairs))
+            else:
+                kept.append((p, lp))
+        for i in sorted(credited):
+            actions.append(f"Removed outdated clause related to '{remove_pairs[i][0]['title']}'")
+        if credited:
+            updated = True
+            paragraphs = [p for p, _ in kept]
+            low = [lp for _, lp in kept]
+
+    return {
+        "contract_file": contract_file,
+        "reg_changes": reg_changes,
+        "regulations": all_regs,
+        "paragraphs": paragraphs,
+        "low": low,
+        "updated": updated,
+        "actions": actions,
+    }
+
+
+def _insertion_state(draft):
+    # Built once per draft and kept on it, so needs_semantic_fallback and
+    # finish_amendment share one presence index and one set of keyword hits
+    if "insertion_state" in draft:
+        return draft["insertion_state"]
+
+    clauses = [reg.get("required_clause", "").strip() for reg in draft["reg_changes"]]
+
+    # Same normalised presence test as check_risks
+    clause_tokens = [normalize_tokens(clause) for clause in clauses]
+    present = ShingleIndex(clause_tokens)
+    present.add_tokens(iter_normalized_tokens(draft["paragraphs"]))
+
+    # Insert-keyword hits per paragraph
+    insert_matcher = keyword_matcher(draft["regulations"], "keywords")
+    para_hits = [insert_matcher.find(lp) for lp in draft["low"]]
+    draft["insertion_state"] = (clauses, clause_tokens, present, insert_matcher, para_hits)
+    return draft["insertion_state"]
+
+
+def needs_semantic_fallback(draft):
+    # True if some clause to insert has no keyword anywhere in the contract.
+    # Inserting clauses only adds text, so False here means finish_amendment
+    # will never need paragraph embeddings
+    if not draft["paragraphs"]:
+        return False
+    _, clause_tokens, present, _, para_hits = _insertion_state(draft)
+    all_hits = set().union(*para_hits)
+    for reg, tokens in zip(draft["reg_changes"], clause_tokens):
+        if present.contains(tokens):
+            continue
+        if not any(kw.lower() in all_hits for kw in reg.get("keywords", [])):
+            return True
+    return False
+
+
+def finish_amendment(draft, notify=True):
+    reg_changes = draft["reg_changes"]
+    contract_file = draft["contract_file"]
+    paragraphs = draft["paragraphs"]
+    low = draft["low"]
+    updated = draft["updated"]
+    actions = draft["actions"]
 
     # ----------- INSERT NEW UPDATED CLAUSE -----------
-    for reg in reg_changes:
-        clause = reg.get("required_clause", "").strip()
+    # Presence index and keyword hits are kept current as clauses are inserted
+    clauses, clause_tokens, present, insert_matcher, para_hits = _insertion_state(draft)
+
+    # paragraphs x clauses similarity, embedded once on the first semantic
+    # fallback and kept aligned with `paragraphs` as clauses are inserted
+    scores = None
+    clause_vecs = None
+
+    for j, reg in enumerate(reg_changes):
+        clause = clauses[j]
 
         # If clause already exists, skip
-        if clause.lower() in "\n".join(paragraphs).lower():
+        if present.contains(clause_tokens[j]):
             continue
 
-        ins_index = -1
-
-        # Keyword-based insertion (first priority)
-        for kw in reg.get("keywords", []):
-            for idx, lp in enumerate(low):
-                if kw.lower() in lp:
-                    ins_index = idx
-                    break
-            if ins_index != -1:
-                break
+        # Keyword-based insertion (first priority): first paragraph hit by
+        # the earliest-listed keyword that occurs anywhere
+        reg_keywords = [kw.lower() for kw in reg.get("keywords", [])]
+        first_hit = {}
+        for idx, hits in enumerate(para_hits):
+            for kw in hits.intersection(reg_keywords):
+                first_hit.setdefault(kw, idx)
+        ins_index = next((first_hit[kw] for kw in reg_keywords if kw in first_hit), -1)
 
         # Semantic fallback (second priority)
-        if ins_index == -1:
-            ins_index = best_semantic_index(paragraphs, clause)
+        if ins_index == -1 and paragraphs:
+            if scores is None:
+                clause_vecs = embed_normalized(clauses)
+                scores = embed_normalized(paragraphs) @ clause_vecs.T
+            ins_index = int(np.argmax(scores[:, j]))
 
         # Place below the matched paragraph
         paragraphs.insert(ins_index + 1, clause)
         low.insert(ins_index + 1, clause.lower())
+        para_hits.insert(ins_index + 1, insert_matcher.find(clause.lower()))
+        present.add_tokens(clause_tokens[j])
+        if scores is not None:
+            # The inserted clause is a paragraph now; its row is clause-to-clause similarity
+            scores = np.insert(scores, ins_index + 1, clause_vecs[j] @ clause_vecs.T, axis=0)
 
         updated = True
         actions.append(f"Inserted updated clause for '{reg['title']}'")
@@ -321,11 +583,97 @@ def apply_amendment(contract_file, reg_changes):
     body = "Contract updated with the following changes:\n\n" + "\n".join(f"- {a}" for a in actions)
 
     # FIXED: Passed correct path (out_path instead of new_pdf_path)
-    send_email_notification(subject, body, attachment_path=out_path)
+    if notify:
+        send_email_notification(subject, body, attachment_path=out_path)
 
     return new_pdf, actions
 
 
+def apply_amendment(contract_file, reg_changes, regulations=None):
+    return finish_amendment(prepare_amendment(contract_file, reg_changes, regulations))
+
+
+# =============================================================================
+#                           BULK AMENDMENT RUNNER
+# =============================================================================
+
+AMEND_WORKERS = int(os.environ.get("AMEND_WORKERS", "8"))
+AMEND_WAVE_SIZE = 200  # Contracts held in memory at once
+
+
+def run_amendments(pdfs, regs, changes=None, workers=AMEND_WORKERS, wave_size=AMEND_WAVE_SIZE):
+    """
+    Amend many contracts concurrently and send one summary email.
+
+    changes=None treats each contract's missing clauses as its changes.
+    Contracts are processed in waves: read + remove in a thread pool, one
+    batched encode for every paragraph that may need semantic placement,
+    then insert + render in the pool. All threads share one embedding model.
+    """
+    summary = {"total": len(pdfs), "updated": [], "unchanged": 0, "failed": []}
+    start = time.time()
+
+    def prepare(p):
+        reg_changes = changes
+        if reg_changes is None:
+            reg_changes = check_risks_stream(stream_pdf(os.path.join(CONTRACTS_DIR, p)), regs)
+        return prepare_amendment(p, reg_changes, regs)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for wave_start in range(0, len(pdfs), wave_size):
+            wave = pdfs[wave_start:wave_start + wave_size]
+
+            drafts = []
+            for p, future in zip(wave, [pool.submit(prepare, p) for p in wave]):
+                try:
+                    drafts.append(future.result())
+                except Exception as e:
+                    summary["failed"].append((p, str(e)))
+
+            # One large encode for the whole wave instead of one per contract
+            texts = []
+            for draft in drafts:
+                if needs_semantic_fallback(draft):
+                    texts.extend(draft["paragraphs"])
+                    texts.extend(reg.get("required_clause", "").strip() for reg in draft["reg_changes"])
+            if texts:
+                warm_embeddings(texts)
+
+            futures = [pool.submit(finish_amendment, draft, False) for draft in drafts]
+            for draft, future in zip(drafts, futures):
+                try:
+                    newfile, actions = future.result()
+                except Exception as e:
+                    summary["failed"].append((draft["contract_file"], str(e)))
+                    continue
+                if newfile:
+                    summary["updated"].append((draft["contract_file"], newfile, actions))
+                    print("Updated:", newfile)
+                else:
+                    summary["unchanged"] += 1
+
+            print(f"… {min(wave_start + wave_size, len(pdfs))}/{len(pdfs)} contracts processed")
+
+    summary["seconds"] = round(time.time() - start, 1)
+
+    print(f"\n📊 Amendments done in {summary['seconds']}s — updated: {len(summary['updated'])}, "
+          f"unchanged: {summary['unchanged']}, failed: {len(summary['failed'])}")
+    for p, error in summary["failed"]:
+        print(f"❌ {p}: {error}")
+
+    if summary["updated"]:
+        lines = []
+        for original, newfile, actions in summary["updated"]:
+            lines.append(f"{original} → {newfile}")
+            lines.extend(f"  - {a}" for a in actions)
+        send_email_notification(
+            f"{len(summary['updated'])} contracts updated",
+            "Contracts updated with the following changes:\n\n" + "\n".join(lines)
+        )
+
+    return summary
+
+
 # =============================================================================
 #                           MENU
 # =============================================================================
@@ -356,8 +704,7 @@ def menu():
 
         elif ch == "3":
             for p in pdfs:
-                text = read_pdf(os.path.join(CONTRACTS_DIR, p))
-                issues = check_risks(text, regs)
+                issues = check_risks_stream(stream_pdf(os.path.join(CONTRACTS_DIR, p)), regs)
                 print(f"\n📌 {p}")
                 if issues:
                     print("Missing:")
@@ -368,21 +715,9 @@ def menu():
 
         elif ch == "4":
             changes = detect_regulation_changes(prev, regs)
-            if not changes:
-                # treat missing clauses as changes
-                for p in pdfs:
-                    txt = read_pdf(os.path.join(CONTRACTS_DIR, p))
-                    issues = check_risks(txt, regs)
-                    newfile, actions = apply_amendment(p, issues)
-                    if newfile:
-                        print("Updated:", newfile)
-                save_prev_regulations(regs)
-            else:
-                for p in pdfs:
-                    newfile, actions = apply_amendment(p, changes)
-                    if newfile:
-                        print("Updated:", newfile)
-                save_prev_regulations(regs)
+            # No changes: treat each contract's missing clauses as changes
+            run_amendments(pdfs, regs, changes or None)
+            save_prev_regulations(regs)
 
         elif ch == "5":
             break
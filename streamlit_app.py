@@ -1,9 +1,14 @@
 import streamlit as st
 import os
+import sys
+import uuid
+import hashlib
+import subprocess
 from datetime import datetime
 from utils.rag_helper import RAGAnalyzer
-from utils.database_utils import save_analysis, get_all_contracts
+from utils.database_utils import get_all_contracts
 from utils.email_notifier import EmailNotifier
+from utils.job_queue import JobQueue
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
@@ -29,6 +34,150 @@ def generate_amendment_recommendation(issue_title):
     
     return "**Recommended Action:** Review this clause against current regulatory standards and industry best practices."
 
+def ask_chatbot(analyzer, question, container):
+    """Stream the chatbot's answer into the chat container, then record it in the history"""
+    st.session_state.chat_history.append({
+        'role': 'user',
+        'content': question
+    })
+    
+    with container:
+        st.markdown(f"**🙋 You:** {question}")
+        st.markdown("**🤖 Assistant:**")
+        
+        try:
+            contract_text = st.session_state.current_contract.get('text', '')
+            
+            if not contract_text:
+                # Load contract text if not in session
+                contract_path = st.session_state.current_contract.get('path', '')
+                if contract_path:
+                    contract_text = analyzer.load_contract(contract_path)
+                    st.session_state.current_contract['text'] = contract_text
+            
+            # Tokens render as they arrive; write_stream returns the full text
+            response = st.write_stream(analyzer.stream_chatbot_response(contract_text, question))
+            
+            # Check for rate limit fallback
+            if "Unable to process due to API rate limits" in response:
+                st.warning("⚠️ Rate limit reached")
+                st.session_state.chat_history.append({
+                    'role': 'assistant',
+                    'content': "The API is rate-limited. Please wait a few minutes and try again."
+                })
+            else:
+                st.session_state.chat_history.append({
+                    'role': 'assistant',
+                    'content': response
+                })
+            
+            st.rerun()
+            
+        except Exception as e:
+            error_msg = str(e)
+            if "429" in error_msg or "rate_limit" in error_msg.lower():
+                st.error("⚠️ Rate limit exceeded. The app is using too many tokens. Please try again in a few minutes.")
+                st.session_state.chat_history.append({
+                    'role': 'assistant',
+                    'content': "⚠️ Rate limit reached. Please wait and try again later."
+                })
+            else:
+                st.error(f"Error: {error_msg}")
+
+def publish_finished_jobs(jobs):
+    """Hand newly finished analyses to the dashboard pages; True if there were any"""
+    published_now = False
+    for job in jobs:
+        if job['status'] != 'done' or job['id'] in st.session_state.published_jobs:
+            continue
+        name = job['filename']
+        # Latest finished contract becomes the one shown on the other pages
+        contract = {
+            'name': name,
+            'path': job['file_path'],
+            'size': os.path.getsize(job['file_path']) if os.path.exists(job['file_path']) else 0,
+            'uploaded_at': datetime.fromtimestamp(job['created_at'])
+        }
+        st.session_state.analyses[name] = {'contract': contract, 'analysis': job['result']}
+        st.session_state.current_contract = contract
+        st.session_state.current_analysis = job['result']
+        st.session_state.published_jobs.add(job['id'])
+        published_now = True
+    return published_now
+
+def sync_analysis_jobs(polling=False):
+    """Sidebar fragment on every page: publishes finished jobs and reruns the page to show them"""
+    jobs = get_job_queue().recent_jobs(st.session_state.session_id)
+    active = [j for j in jobs if j['status'] in ('queued', 'running')]
+    if active:
+        st.caption(f"⏳ {len(active)} contract analysis job(s) in progress")
+    # Full rerun on new results, and once polling is no longer needed
+    if publish_finished_jobs(jobs) or (polling and not active):
+        st.rerun()
+
+def show_analysis_jobs():
+    """Per-file progress polled from the job table"""
+    queue = get_job_queue()
+    jobs = queue.recent_jobs(st.session_state.session_id)
+    for job in jobs:
+        name = job['filename']
+        st.progress(job['progress'] or 0, text=f"**{name}** — {job['message']}")
+        
+        if job['status'] == 'running' and job['preview']:
+            st.code(job['preview'], language="json")
+        
+        if job['status'] == 'done':
+            analysis_result = job['result']
+            issues = analysis_result.get('compliance_issues', [])
+            high = len([i for i in issues if i.get('risk_level') == 'High'])
+            notes = []
+            if analysis_result.get('cached'):
+                notes.append("♻️ cached result")
+            if analysis_result.get('incomplete'):
+                notes.append("⚠️ incomplete: some sections were rate-limited or unreadable")
+            if analysis_result.get('truncated'):
+                notes.append("⚠️ truncated: token budget reached")
+            coverage = analysis_result.get('coverage')
+            if coverage and coverage['sections_analyzed'] < coverage['sections_total']:
+                notes.append(f"⚠️ {coverage['sections_analyzed']}/{coverage['sections_total']} sections analyzed")
+            st.caption(f"Clauses: {len(analysis_result.get('key_clauses', []))} · Issues: {len(issues)} · "
+                       f"High Risk: {high}" + (f" · {' · '.join(notes)}" if notes else ""))
+
+
+# Job table shared with job_worker.py; survives reruns and browser refreshes
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+@st.cache_resource
+def get_worker_handle():
+    return {'process': None}
+
+def ensure_job_worker(queue):
+    """
+    Start a background worker process unless one is already running.
+    
+    Returns the error of a worker that failed to start, in which case no
+    new worker is started until queue.clear_worker_errors() is called.
+    """
+    handle = get_worker_handle()
+    process = handle['process']
+    if (process is not None and process.poll() is None) or queue.worker_alive():
+        return None
+    worker_error = queue.worker_error()
+    if worker_error:
+        return worker_error
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    handle['process'] = subprocess.Popen([sys.executable, os.path.join(app_dir, "job_worker.py")], cwd=app_dir)
+    return None
+
+# One analyzer per worker process, shared by every page and session
+@st.cache_resource
+def get_rag_analyzer():
+    analyzer = RAGAnalyzer()
+    analyzer.setup()
+    return analyzer
+
 # Page configuration
 st.set_page_config(
     page_title="Contract Compliance Analyzer",
@@ -59,6 +208,14 @@ if 'uploaded_contracts' not in st.session_state:
     st.session_state.uploaded_contracts = []
 if 'current_contract' not in st.session_state:
     st.session_state.current_contract = None
+if 'published_jobs' not in st.session_state:
+    st.session_state.published_jobs = set()
+if 'analyses' not in st.session_state:
+    st.session_state.analyses = {}
+if 'session_id' not in st.session_state:
+    # Kept in the URL so a browser refresh finds this session's jobs again
+    st.session_state.session_id = st.query_params.get('session') or uuid.uuid4().hex
+    st.query_params['session'] = st.session_state.session_id
 
 # Sidebar navigation
 st.sidebar.title("🔐 Contract Compliance Analyzer")
@@ -72,6 +229,15 @@ page = st.sidebar.radio(
 st.sidebar.markdown("---")
 st.sidebar.info("💡 Tip: Upload a contract to get started with compliance analysis")
 
+# Finished analyses reach whichever page is open, not just the upload page
+try:
+    session_jobs = get_job_queue().recent_jobs(st.session_state.session_id)
+    polling = any(j['status'] in ('queued', 'running') for j in session_jobs)
+    with st.sidebar:
+        st.fragment(sync_analysis_jobs, run_every=2 if polling else None)(polling)
+except Exception as e:
+    st.sidebar.error(f"Error reading analysis jobs: {str(e)}")
+
 # Main content
 if page == "🏠 Home":
     st.markdown("<h1 class='main-header'>📋 Contract Compliance Analyzer</h1>", unsafe_allow_html=True)
@@ -165,116 +331,71 @@ elif page == "📤 Upload Contract":
     
     st.markdown("---")
     
-    # Initialize RAG analyzer
-    @st.cache_resource
-    def get_rag_analyzer():
-        analyzer = RAGAnalyzer()
-        analyzer.setup()
-        return analyzer
-    
+    # Job table and background worker; analyses run outside this script
+    worker_error = None
     try:
-        analyzer = get_rag_analyzer()
+        queue = get_job_queue()
+        worker_error = ensure_job_worker(queue)
     except Exception as e:
-        st.error(f"Error initializing RAG system: {str(e)}")
-        analyzer = None
+        st.error(f"Error starting analysis worker: {str(e)}")
+        queue = None
+    
+    if worker_error:
+        st.error(f"❌ {worker_error}")
+        if st.button("🔁 Retry starting the analysis worker"):
+            queue.clear_worker_errors()
+            st.rerun()
     
-    # Simple file uploader without extra features
-    uploaded_file = st.file_uploader(
-        "Select a contract file (PDF or TXT)",
+    # Multi-file uploader; analyses run in the background so the page never blocks
+    uploaded_files = st.file_uploader(
+        "Select contract files (PDF or TXT)",
         type=["pdf", "txt"],
-        accept_multiple_files=False
+        accept_multiple_files=True
     )
     
-    if uploaded_file is not None:
+    if uploaded_files:
         try:
-            st.success(f"✅ Selected: {uploaded_file.name}")
-            
-            # Create uploads directory
-            os.makedirs("data/uploads", exist_ok=True)
-            
-            # Save file directly
-            file_path = f"data/uploads/{uploaded_file.name}"
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.read())
-            
-            st.info(f"File saved successfully")
-            
-            # Store in session
-            st.session_state.current_contract = {
-                'name': uploaded_file.name,
-                'path': file_path,
-                'size': len(uploaded_file.getvalue()),
-                'uploaded_at': datetime.now()
-            }
+            st.success(f"✅ Selected: {', '.join(f.name for f in uploaded_files)}")
             
             st.markdown("---")
             
             # Analyze button
-            if st.button("🔍 Analyze This Contract", use_container_width=True):
-                if analyzer is None:
-                    st.error("❌ RAG system error. Check your setup.")
+            label = "🔍 Analyze This Contract" if len(uploaded_files) == 1 else f"🔍 Analyze {len(uploaded_files)} Contracts"
+            if st.button(label, use_container_width=True):
+                if queue is None or worker_error:
+                    st.error("❌ Analysis worker error. Check your setup.")
                 else:
-                    progress = st.progress(0)
-                    status = st.empty()
-                    
-                    try:
-                        status.text("📖 Loading contract...")
-                        progress.progress(20)
-                        
-                        contract_text = analyzer.load_contract(file_path)
-                        st.session_state.current_contract['text'] = contract_text
-                        
-                        status.text("🔍 Analyzing compliance...")
-                        progress.progress(50)
-                        
-                        analysis_result = analyzer.analyze_contract(contract_text)
-                        st.session_state.current_analysis = analysis_result
-                        
-                        status.text("💾 Saving results...")
-                        progress.progress(80)
-                        
-                        save_analysis(uploaded_file.name, file_path, {
-                            'clauses': analysis_result.get('key_clauses', []),
-                            'issues': analysis_result.get('compliance_issues', [])
-                        })
-                        
-                        progress.progress(100)
-                        status.text("✅ Analysis complete!")
-                        
-                        # Send email notification in background (non-blocking)
-                        if st.session_state.get('notification_email'):
-                            try:
-                                email_notifier = EmailNotifier()
-                                if email_notifier.is_email_enabled():
-                                    email_notifier.send_notification_safe(
-                                        st.session_state['notification_email'],
-                                        uploaded_file.name,
-                                        analysis_result
-                                    )
-                            except:
-                                pass  # Silently fail to not block UI
-                        
-                        st.balloons()
-                        st.success("✅ Successfully analyzed! Check other pages for results.")
-                        
-                        # Quick summary
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric("Clauses", len(analysis_result.get('key_clauses', [])))
-                        with col2:
-                            st.metric("Issues", len(analysis_result.get('compliance_issues', [])))
-                        with col3:
-                            issues = analysis_result.get('compliance_issues', [])
-                            high = len([i for i in issues if i.get('risk_level') == 'High'])
-                            st.metric("High Risk", high)
-                        
-                    except Exception as e:
-                        st.error(f"❌ Analysis failed: {str(e)}")
+                    session_id = st.session_state.session_id
+                    for uploaded_file in uploaded_files:
+                        # Skip files that are already queued or being analyzed
+                        if queue.is_active(session_id, uploaded_file.name):
+                            st.info(f"⏳ {uploaded_file.name} is already being analyzed")
+                            continue
+                        # One directory per content hash, so same-named uploads never overwrite each other
+                        content = uploaded_file.getvalue()
+                        upload_dir = os.path.join("data", "uploads", hashlib.sha256(content).hexdigest()[:16])
+                        os.makedirs(upload_dir, exist_ok=True)
+                        file_path = os.path.join(upload_dir, uploaded_file.name)
+                        with open(file_path, "wb") as f:
+                            f.write(content)
+                        queue.enqueue(session_id, uploaded_file.name, file_path,
+                                      st.session_state.get('notification_email'))
         
         except Exception as e:
             st.error(f"❌ Error: {str(e)}")
     
-    else:
+    jobs = queue.recent_jobs(st.session_state.session_id) if queue is not None else []
+    if jobs:
+        st.markdown("---")
+        st.markdown("#### ⏱️ Analysis Progress")
+        active = any(j['status'] in ('queued', 'running') for j in jobs)
+        # Poll only while something is still running
+        st.fragment(show_analysis_jobs, run_every=2 if active else None)()
+        if not active and st.button("🧹 Clear finished jobs"):
+            queue.clear_finished(st.session_state.session_id)
+            st.rerun()
+    
+    if not uploaded_files and not jobs:
         st.markdown("---")
         st.info("👆 Click 'Browse files' above to select a contract")
         
@@ -305,6 +426,15 @@ elif page == "📊 Risk Analysis":
         else:
             st.info("No contracts analyzed yet.")
     else:
+        # Switch between contracts analyzed in this session
+        if len(st.session_state.analyses) > 1:
+            names = list(st.session_state.analyses)
+            current_name = st.session_state.current_contract['name']
+            selected = st.selectbox("Analyzed contracts:", names,
+                                    index=names.index(current_name) if current_name in names else 0)
+            st.session_state.current_contract = st.session_state.analyses[selected]['contract']
+            st.session_state.current_analysis = st.session_state.analyses[selected]['analysis']
+        
         analysis = st.session_state.current_analysis
         contract_name = st.session_state.current_contract['name']
         
@@ -485,15 +615,9 @@ elif page == "💬 Chatbot":
         if 'chat_history' not in st.session_state:
             st.session_state.chat_history = []
         
-        # Initialize RAG analyzer for chatbot
-        @st.cache_resource
-        def get_chatbot_analyzer():
-            analyzer = RAGAnalyzer()
-            analyzer.setup()
-            return analyzer
-        
+        # Chatbot shares the analyzer (and its embedding model) with the upload page
         try:
-            analyzer = get_chatbot_analyzer()
+            analyzer = get_rag_analyzer()
         except Exception as e:
             st.error(f"Error initializing chatbot: {str(e)}")
             analyzer = None
@@ -526,53 +650,7 @@ elif page == "💬 Chatbot":
             if analyzer is None:
                 st.error("Chatbot not initialized. Please check your setup.")
             else:
-                # Add user message to history
-                st.session_state.chat_history.append({
-                    'role': 'user',
-                    'content': user_question
-                })
-                
-                # Get bot response with rate limit handling
-                with st.spinner("🤔 Thinking..."):
-                    try:
-                        contract_text = st.session_state.current_contract.get('text', '')
-                        
-                        if not contract_text:
-                            # Load contract text if not in session
-                            contract_path = st.session_state.current_contract.get('path', '')
-                            if contract_path:
-                                contract_text = analyzer.load_contract(contract_path)
-                                st.session_state.current_contract['text'] = contract_text
-                        
-                        response = analyzer.get_chatbot_response(contract_text, user_question)
-                        
-                        # Check for rate limit fallback
-                        if "Unable to process due to API rate limits" in response:
-                            st.warning("⚠️ " + response)
-                            st.session_state.chat_history.append({
-                                'role': 'assistant',
-                                'content': "The API is rate-limited. Please wait a few minutes and try again."
-                            })
-                        else:
-                            # Add bot response to history
-                            st.session_state.chat_history.append({
-                                'role': 'assistant',
-                                'content': response
-                            })
-                            st.success("✅ Response generated!")
-                        
-                        st.rerun()
-                        
-                    except Exception as e:
-                        error_msg = str(e)
-                        if "429" in error_msg or "rate_limit" in error_msg.lower():
-                            st.error("⚠️ Rate limit exceeded. The app is using too many tokens. Please try again in a few minutes.")
-                            st.session_state.chat_history.append({
-                                'role': 'assistant',
-                                'content': "⚠️ Rate limit reached. Please wait and try again later."
-                            })
-                        else:
-                            st.error(f"Error: {error_msg}")
+                ask_chatbot(analyzer, user_question, chat_container)
         
         # Quick question suggestions
         st.markdown("---")
@@ -591,49 +669,13 @@ elif page == "💬 Chatbot":
         for idx, suggestion in enumerate(suggestions):
             with cols[idx % 2]:
                 if st.button(f"💬 {suggestion}", key=f"suggest_{idx}"):
-                    st.session_state.chat_history.append({
-                        'role': 'user',
-                        'content': suggestion
-                    })
-                    
                     if analyzer is not None:
-                        with st.spinner("🤔 Thinking..."):
-                            try:
-                                contract_text = st.session_state.current_contract.get('text', '')
-                                
-                                if not contract_text:
-                                    contract_path = st.session_state.current_contract.get('path', '')
-                                    if contract_path:
-                                        contract_text = analyzer.load_contract(contract_path)
-                                        st.session_state.current_contract['text'] = contract_text
-                                
-                                response = analyzer.get_chatbot_response(contract_text, suggestion)
-                                
-                                # Check for rate limit fallback
-                                if "Unable to process due to API rate limits" in response:
-                                    st.warning("⚠️ Rate limit reached")
-                                    st.session_state.chat_history.append({
-                                        'role': 'assistant',
-                                        'content': "⚠️ Rate limit reached. Please try again in a few minutes."
-                                    })
-                                else:
-                                    st.session_state.chat_history.append({
-                                        'role': 'assistant',
-                                        'content': response
-                                    })
-                                
-                                st.rerun()
-                                
-                            except Exception as e:
-                                error_msg = str(e)
-                                if "429" in error_msg or "rate_limit" in error_msg.lower():
-                                    st.error("⚠️ Rate limit exceeded")
-                                    st.session_state.chat_history.append({
-                                        'role': 'assistant',
-                                        'content': "⚠️ Rate limit reached. Please wait and try again."
-                                    })
-                                else:
-                                    st.error(f"Error: {error_msg}")
+                        ask_chatbot(analyzer, suggestion, chat_container)
+                    else:
+                        st.session_state.chat_history.append({
+                            'role': 'user',
+                            'content': suggestion
+                        })
         
         # Clear chat history button
         st.markdown("---")
@@ -793,6 +835,20 @@ elif page == "⚙️ Settings":
         email_status = "✅ Configured" if email_notifier.is_email_enabled() else "❌ Not Configured"
         st.write(f"**Email Notifications:** {email_status}")
     
+    st.markdown("---")
+    st.markdown("#### 📈 Groq Token Usage (this worker)")
+    
+    try:
+        usage = get_rag_analyzer().get_usage_summary()
+        if usage:
+            usage_df = pd.DataFrame.from_dict(usage, orient='index')
+            usage_df.index.name = 'Model'
+            st.dataframe(usage_df, use_container_width=True)
+        else:
+            st.info("No API calls recorded yet.")
+    except Exception as e:
+        st.warning(f"Could not load token usage: {str(e)}")
+    
     st.markdown("---")
     st.markdown("#### 🆘 Support")
     
@@ -0,0 +1,67 @@
+"""
+Embedding Registry - keeps one shared copy of each embedding model per process
+"""
+import os
+import threading
+from typing import Dict, Optional
+
+# Set to a model name to make every caller share that single model
+SINGLE_MODEL_ENV = "EMBEDDING_SINGLE_MODEL"
+
+
+class EmbeddingRegistry:
+    """
+    Process-wide registry of HuggingFace embedding models.
+
+    Models are loaded lazily on first acquire() and reference counted so
+    they can be dropped once the last user calls release(). In single-model
+    mode every requested name resolves to the same model.
+    """
+
+    def __init__(self, single_model: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._refcounts = {}
+        self.single_model = single_model or os.environ.get(SINGLE_MODEL_ENV) or None
+
+    def resolve(self, model_name: str) -> str:
+        """Name of the model that will actually serve model_name"""
+        return self.single_model or model_name
+
+    def acquire(self, model_name: str):
+        """Get the shared LangChain embeddings object, loading it if needed"""
+        name = self.resolve(model_name)
+        with self._lock:
+            if name not in self._models:
+                from langchain_community.embeddings import HuggingFaceEmbeddings
+                self._models[name] = HuggingFaceEmbeddings(model_name=name)
+            self._refcounts[name] = self._refcounts.get(name, 0) + 1
+            return self._models[name]
+
+    def acquire_sentence_transformer(self, model_name: str):
+        """Get the underlying SentenceTransformer for callers that encode directly"""
+        return self.acquire(model_name).client
+
+    def release(self, model_name: str):
+        """Drop one reference; the model is unloaded when nobody holds it"""
+        name = self.resolve(model_name)
+        with self._lock:
+            count = self._refcounts.get(name, 0) - 1
+            if count > 0:
+                self._refcounts[name] = count
+                return
+            self._refcounts.pop(name, None)
+            self._models.pop(name, None)
+
+    def loaded_models(self) -> Dict[str, int]:
+        """Currently loaded model names and their reference counts"""
+        with self._lock:
+            return dict(self._refcounts)
+
+
+_registry = EmbeddingRegistry()
+
+
+def get_registry() -> EmbeddingRegistry:
+    """Return the process-wide embedding registry"""
+    return _registry
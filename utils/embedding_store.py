@@ -0,0 +1,155 @@
+"""
+Embedding Store - persistent float16 embeddings keyed by model name and text hash
+
+Vectors live in one append-only raw float16 file per model that is read
+through np.memmap, so opening the store costs nothing and a lookup only
+touches the rows it needs. A SQLite table maps text hashes to rows.
+"""
+import hashlib
+import os
+import re
+import threading
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from utils.sqlite_helpers import ThreadConnections, immediate_transaction
+
+EMBEDDING_STORE_DIR = os.path.join("data", "embedding_store")
+VECTORS_FILE = "vectors.f16"
+INDEX_DB = "index.db"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Embeddings for one model, computed at most once per distinct text.
+
+    embed() returns float16 vectors in input order and only calls the
+    encoder for texts the store has never seen. Appends happen under
+    BEGIN IMMEDIATE on the index, so several processes can share a store.
+    """
+
+    def __init__(self, model_name: str, store_dir: str = EMBEDDING_STORE_DIR):
+        self.model_name = model_name
+        self.path = os.path.join(store_dir, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name))
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = os.path.join(self.path, VECTORS_FILE)
+        self._db = ThreadConnections(os.path.join(self.path, INDEX_DB), pragmas=('journal_mode=WAL',))
+        self._lock = threading.Lock()
+        self._memmap = None
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize index and metadata tables"""
+        conn = self._db.get()
+        conn.execute('CREATE TABLE IF NOT EXISTS vectors (text_hash TEXT PRIMARY KEY, row INTEGER NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Vector width, known once the first vector has been stored"""
+        row = self._db.get().execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def __len__(self) -> int:
+        return self._db.get().execute('SELECT COUNT(*) FROM vectors').fetchone()[0]
+
+    def _vectors(self, dim: int, min_rows: int) -> np.ndarray:
+        """Read-only memmap over the vector file, remapped when it has grown"""
+        with self._lock:
+            if self._memmap is None or self._memmap.shape[0] < min_rows:
+                rows = os.path.getsize(self.vectors_path) // (dim * 2)
+                self._memmap = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, dim))
+            return self._memmap
+
+    def _lookup(self, hashes: List[str]) -> dict:
+        conn = self._db.get()
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), 500):  # Stay under SQLite's parameter limit
+            batch = unique[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(
+                f'SELECT text_hash, row FROM vectors WHERE text_hash IN ({placeholders})', batch
+            ).fetchall())
+        return found
+
+    def _append(self, hashes: List[str], vectors: np.ndarray) -> dict:
+        """Store new vectors; returns hash -> row for them (another process may have won the race)"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float16)
+        conn = self._db.get()
+        with immediate_transaction(conn):
+            stored_dim = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            if stored_dim is None:
+                conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(vectors.shape[1]),))
+            elif int(stored_dim[0]) != vectors.shape[1]:
+                raise ValueError(f"Embedding width {vectors.shape[1]} does not match store width {stored_dim[0]}")
+
+            existing = dict(conn.execute(
+                f'SELECT text_hash, row FROM vectors WHERE text_hash IN ({",".join("?" * len(hashes))})', hashes
+            ).fetchall())
+            new = [i for i, h in enumerate(hashes) if h not in existing]
+
+            row_bytes = vectors.shape[1] * 2
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            next_row = size // row_bytes
+            with open(self.vectors_path, "ab") as f:
+                # Drop a partial row left by a crash mid-write before appending
+                f.truncate(next_row * row_bytes)
+                f.write(vectors[new].tobytes())
+            rows = {hashes[i]: next_row + n for n, i in enumerate(new)}
+            conn.executemany('INSERT INTO vectors (text_hash, row) VALUES (?, ?)', list(rows.items()))
+        return {**existing, **rows}
+
+    def _ensure(self, texts: List[str], hashes: List[str], encode: Callable[[List[str]], np.ndarray],
+                encode_batch: int) -> dict:
+        rows = self._lookup(hashes)
+        missing = list(dict.fromkeys(h for h in hashes if h not in rows))
+        if missing:
+            first_text = {}
+            for t, h in zip(texts, hashes):
+                first_text.setdefault(h, t)
+            for start in range(0, len(missing), encode_batch):
+                batch = missing[start:start + encode_batch]
+                vectors = encode([first_text[h] for h in batch])
+                for offset in range(0, len(batch), 500):  # Stay under SQLite's parameter limit
+                    rows.update(self._append(batch[offset:offset + 500], vectors[offset:offset + 500]))
+        return rows
+
+    def ensure(self, texts: List[str], encode: Callable[[List[str]], np.ndarray], encode_batch: int = 4096) -> int:
+        """Store vectors for every unseen text, encoding up to encode_batch texts per call; returns how many were new"""
+        hashes = [text_hash(t) for t in texts]
+        before = len(self)
+        self._ensure(texts, hashes, encode, encode_batch)
+        return len(self) - before
+
+    def embed(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for texts, in order, as a float16 (len(texts), dim) array.
+
+        encode is only called with the distinct texts that are not stored yet.
+        """
+        hashes = [text_hash(t) for t in texts]
+        rows = self._ensure(texts, hashes, encode, 500)
+
+        dim = self.dim
+        if not texts:
+            return np.zeros((0, dim or 0), dtype=np.float16)
+        order = np.fromiter((rows[h] for h in hashes), dtype=np.int64, count=len(hashes))
+        return np.asarray(self._vectors(dim, int(order.max()) + 1)[order])
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(model_name: str) -> EmbeddingStore:
+    """Return the process-wide store for model_name"""
+    with _stores_lock:
+        if model_name not in _stores:
+            _stores[model_name] = EmbeddingStore(model_name)
+        return _stores[model_name]
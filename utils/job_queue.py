@@ -0,0 +1,238 @@
+"""
+Job Queue - SQLite-backed analysis jobs shared by Streamlit and job_worker.py
+
+Streamlit only enqueues jobs and polls their rows, so an analysis keeps
+running (and its result stays available) across script reruns, page
+switches and browser refreshes.
+"""
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.sqlite_helpers import ThreadConnections, immediate_transaction
+
+JOBS_DB_PATH = "data/jobs.db"
+
+# A running job whose worker has not checked in for this long is requeued
+STALE_AFTER = 60.0
+
+# A job whose worker died this many times is failed instead of requeued again
+MAX_ATTEMPTS = 3
+
+# Columns added after the first release, with their definitions
+JOB_COLUMNS = {
+    "owner": "TEXT",
+    "attempts": "INTEGER DEFAULT 0",
+}
+
+
+class JobQueue:
+    """
+    Contract analysis jobs: queued -> running -> done | failed.
+
+    Every job records the session that enqueued it (owner), and the
+    Streamlit-side queries only ever see that session's jobs.
+    Workers claim the oldest queued job inside BEGIN IMMEDIATE so two
+    workers never pick up the same row. Each worker also heartbeats in the
+    workers table, which is how Streamlit knows whether one is alive.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH):
+        self.db_path = db_path
+        self._db = ThreadConnections(db_path, row_factory=sqlite3.Row,
+                                     pragmas=('journal_mode=WAL', 'synchronous=NORMAL'))
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize job and worker tables"""
+        conn = self._db.get()
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner TEXT,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            notification_email TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress INTEGER DEFAULT 0,
+            message TEXT,
+            preview TEXT DEFAULT '',
+            result_json TEXT,
+            error TEXT,
+            worker_pid INTEGER,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            heartbeat REAL,
+            attempts INTEGER DEFAULT 0
+        )''')
+        # Job tables created before a column existed get it added in place
+        columns = {row["name"] for row in conn.execute('PRAGMA table_info(jobs)')}
+        for column, definition in JOB_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs(owner, id)')
+        conn.execute('''CREATE TABLE IF NOT EXISTS workers (
+            pid INTEGER PRIMARY KEY,
+            heartbeat REAL,
+            error TEXT
+        )''')
+        if 'error' not in {row["name"] for row in conn.execute('PRAGMA table_info(workers)')}:
+            conn.execute('ALTER TABLE workers ADD COLUMN error TEXT')
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job["result"] = json.loads(job.pop("result_json")) if job.get("result_json") else None
+        return job
+
+    # ------------------------------------------------------------------
+    # Streamlit side
+    # ------------------------------------------------------------------
+
+    def enqueue(self, owner: str, filename: str, file_path: str, notification_email: Optional[str] = None) -> int:
+        """Add an analysis job for owner (a session id) and return its id"""
+        cur = self._db.get().execute(
+            'INSERT INTO jobs (owner, filename, file_path, notification_email, message, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (owner, filename, file_path, notification_email, "⏳ Queued...", time.time())
+        )
+        return cur.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        row = self._db.get().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def recent_jobs(self, owner: str, max_age: float = 86400, limit: int = 50) -> List[Dict]:
+        """owner's jobs created within max_age seconds, oldest first"""
+        rows = self._db.get().execute(
+            'SELECT * FROM jobs WHERE owner = ? AND created_at >= ? ORDER BY id DESC LIMIT ?',
+            (owner, time.time() - max_age, limit)
+        ).fetchall()
+        return [self._row_to_job(row) for row in reversed(rows)]
+
+    def is_active(self, owner: str, filename: str) -> bool:
+        """True if owner already has a queued or running job for filename"""
+        row = self._db.get().execute(
+            "SELECT 1 FROM jobs WHERE owner = ? AND filename = ? AND status IN ('queued', 'running')",
+            (owner, filename)
+        ).fetchone()
+        return row is not None
+
+    def worker_alive(self) -> bool:
+        """True if any worker has sent a heartbeat recently"""
+        row = self._db.get().execute(
+            'SELECT 1 FROM workers WHERE error IS NULL AND heartbeat >= ?', (time.time() - STALE_AFTER,)
+        ).fetchone()
+        return row is not None
+
+    def worker_error(self) -> Optional[str]:
+        """Why the last worker failed to start, until clear_worker_errors() or a worker starts cleanly"""
+        row = self._db.get().execute(
+            'SELECT error FROM workers WHERE error IS NOT NULL ORDER BY heartbeat DESC LIMIT 1'
+        ).fetchone()
+        return row["error"] if row else None
+
+    def clear_worker_errors(self):
+        self._db.get().execute('DELETE FROM workers WHERE error IS NOT NULL')
+
+    def clear_finished(self, owner: str):
+        """Remove owner's done and failed jobs"""
+        self._db.get().execute("DELETE FROM jobs WHERE owner = ? AND status IN ('done', 'failed')", (owner,))
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def claim(self, worker_pid: int) -> Optional[Dict]:
+        """Mark the oldest queued job as running for this worker and return it"""
+        conn = self._db.get()
+        now = time.time()
+        with immediate_transaction(conn):
+            row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, heartbeat = ?, "
+                    "progress = 0, preview = '', error = NULL, attempts = COALESCE(attempts, 0) + 1 WHERE id = ?",
+                    (worker_pid, now, now, row["id"])
+                )
+        return self.get(row["id"]) if row is not None else None
+
+    def update(self, job_id: int, progress: Optional[int] = None, message: Optional[str] = None,
+               preview: Optional[str] = None):
+        """Report progress on a running job"""
+        fields = {"heartbeat": time.time()}
+        if progress is not None:
+            fields["progress"] = progress
+        if message is not None:
+            fields["message"] = message
+        if preview is not None:
+            fields["preview"] = preview
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._db.get().execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def complete(self, job_id: int, result: Dict, message: str = "✅ Analysis complete!"):
+        now = time.time()
+        self._db.get().execute(
+            "UPDATE jobs SET status = 'done', progress = 100, message = ?, result_json = ?, preview = '', "
+            "finished_at = ?, heartbeat = ? WHERE id = ?",
+            (message, json.dumps(result), now, now, job_id)
+        )
+
+    def fail(self, job_id: int, error: str):
+        now = time.time()
+        self._db.get().execute(
+            "UPDATE jobs SET status = 'failed', message = ?, error = ?, finished_at = ?, heartbeat = ? WHERE id = ?",
+            (f"❌ Analysis failed: {error}", error, now, now, job_id)
+        )
+
+    def heartbeat(self, worker_pid: int, job_id: Optional[int] = None):
+        """Record that a worker (and the job it is running) is still alive"""
+        now = time.time()
+        conn = self._db.get()
+        conn.execute('INSERT OR REPLACE INTO workers (pid, heartbeat) VALUES (?, ?)', (worker_pid, now))
+        if job_id is not None:
+            conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ?', (now, job_id))
+
+    def worker_failed(self, worker_pid: int, error: str):
+        """Record that a worker could not start, and fail the queued jobs nobody will pick up"""
+        now = time.time()
+        message = f"Analysis worker could not start: {error}"
+        conn = self._db.get()
+        with immediate_transaction(conn):
+            conn.execute('INSERT OR REPLACE INTO workers (pid, heartbeat, error) VALUES (?, ?, ?)',
+                         (worker_pid, now, error))
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', message = ?, error = ?, finished_at = ? WHERE status = 'queued'",
+                (f"❌ {message}", message, now)
+            )
+
+    def unregister_worker(self, worker_pid: int):
+        self._db.get().execute('DELETE FROM workers WHERE pid = ?', (worker_pid,))
+
+    def requeue_stale(self) -> int:
+        """
+        Put running jobs whose worker died back in the queue.
+
+        A job that has already been claimed MAX_ATTEMPTS times is failed
+        instead, so a contract that crashes its worker cannot loop forever.
+        Returns the number of jobs requeued.
+        """
+        conn = self._db.get()
+        now = time.time()
+        error = f"Worker stopped {MAX_ATTEMPTS} times while analyzing this contract"
+        with immediate_transaction(conn):
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', message = ?, error = ?, worker_pid = NULL, finished_at = ? "
+                "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+                (f"❌ Analysis failed: {error}", error, now, now - STALE_AFTER, MAX_ATTEMPTS)
+            )
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', message = ?, worker_pid = NULL "
+                "WHERE status = 'running' AND heartbeat < ?",
+                ("⏳ Requeued after worker stopped...", now - STALE_AFTER)
+            )
+        return cur.rowcount
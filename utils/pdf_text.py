@@ -0,0 +1,151 @@
+"""
+PDF Text - streamed page and paragraph extraction, split across a process pool for large PDFs
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pypdf
+
+# Below this many pages the pool start-up and per-worker re-parse cost more than they save
+PARALLEL_PAGE_THRESHOLD = 40
+
+# Page ranges per worker; more than one evens out pages of uneven density
+RANGES_PER_WORKER = 2
+
+# Upper bound on a range, which bounds how many pages are in flight when streaming
+MAX_PAGES_PER_RANGE = 25
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _extract_range(path: str, start: int, end: int) -> List[str]:
+    """Text of pages [start, end); runs in a pool worker, so it opens its own reader"""
+    reader = pypdf.PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    """Split page_count pages into at most `parts` contiguous, ordered ranges"""
+    parts = max(1, min(parts, page_count))
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def pool_context():
+    """
+    Start method for process pools: forkserver where the platform has it, else spawn.
+
+    Forking a threaded process (Streamlit, the job worker, the async batch
+    runner) is unsafe. The fork server imports pypdf once and every worker
+    is forked from it already loaded. Workers still import the main script,
+    so scripts that use these pools keep their heavy imports inside main().
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared extraction pool, created on first use"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+            _pool_workers = workers
+        return _pool
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_pool)
+
+
+def iter_pdf_pages(path: str, workers: Optional[int] = None,
+                   parallel_threshold: int = PARALLEL_PAGE_THRESHOLD) -> Iterator[str]:
+    """
+    Yield the text of every page, in page order.
+
+    PDFs with at least parallel_threshold pages are split into contiguous
+    page ranges that are extracted in parallel worker processes and
+    yielded in order. Only `workers` ranges are in flight at a time, so
+    memory stays bounded however long the document is. Pass workers=1 to
+    force serial extraction, e.g. when the caller is already running
+    inside a process pool.
+    """
+    reader = pypdf.PdfReader(path)
+    page_count = len(reader.pages)
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or page_count < parallel_threshold:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    pool = _get_pool(workers)
+    parts = max(workers * RANGES_PER_WORKER, -(-page_count // MAX_PAGES_PER_RANGE))
+    ranges = _page_ranges(page_count, parts)
+    in_flight = deque()
+    for start, end in ranges:
+        in_flight.append(pool.submit(_extract_range, path, start, end))
+        if len(in_flight) > workers:
+            yield from in_flight.popleft().result()
+    while in_flight:
+        yield from in_flight.popleft().result()
+
+
+def extract_pdf_pages(path: str, workers: Optional[int] = None,
+                      parallel_threshold: int = PARALLEL_PAGE_THRESHOLD) -> List[str]:
+    """Text of every page, in page order (see iter_pdf_pages)"""
+    return list(iter_pdf_pages(path, workers=workers, parallel_threshold=parallel_threshold))
+
+
+def iter_paragraphs(pages: Iterable[str], page_separator: str = "\n") -> Iterator[str]:
+    """
+    Yield the blank-line separated paragraphs of a page stream.
+
+    Gives the same paragraphs as splitting page_separator.join(pages) on
+    blank lines, but only holds the paragraph currently being read, so a
+    paragraph running over a page break is still yielded whole.
+    """
+    pending = []  # Pieces of the paragraph being read, minus its last character
+    edge = ""     # That last character; the only place a blank line can start across pages
+    first = True
+    for page in pages:
+        # Only the new page (and the edge) is split, so a paragraph spanning
+        # many pages costs linear, not quadratic, time
+        text = edge + (page if first else page_separator + page)
+        first = False
+        parts = text.split("\n\n")
+        if len(parts) > 1:
+            paragraph = ("".join(pending) + parts[0]).strip()
+            if paragraph:
+                yield paragraph
+            for part in parts[1:-1]:
+                if part.strip():
+                    yield part.strip()
+            pending = []
+        pending.append(parts[-1][:-1])
+        edge = parts[-1][-1:]
+    paragraph = ("".join(pending) + edge).strip()
+    if paragraph:
+        yield paragraph
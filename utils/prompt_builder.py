@@ -0,0 +1,102 @@
+"""
+Prompt Builder - packs instructions, retrieved standards and contract text into a token budget
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Smallest leftover worth filling with a truncated passage
+MIN_PARTIAL_TOKENS = 40
+
+
+def split_passages(text: str) -> List[str]:
+    """Split text into paragraphs, falling back to lines for PDF text without blank lines"""
+    passages = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+    if len(passages) <= 1:
+        passages = [p.strip() for p in text.split('\n') if p.strip()]
+    return passages
+
+
+def keyword_scores(passages: List[str], query: str) -> List[Tuple[str, float]]:
+    """Score passages by how many distinct query words they contain"""
+    words = {w for w in re.findall(r'[a-z0-9]+', query.lower()) if len(w) > 2}
+    scored = []
+    for passage in passages:
+        passage_words = set(re.findall(r'[a-z0-9]+', passage.lower()))
+        scored.append((passage, float(len(words & passage_words))))
+    return scored
+
+
+class PromptBuilder:
+    """
+    Fills a prompt template within a total token budget.
+
+    The template text itself (the instructions) is always kept whole. Each
+    named block gets its own token budget and is filled with the
+    highest-scoring passages that fit; one block may take "the rest" of the
+    budget, including whatever the fixed blocks left unused. Selected
+    passages are rendered in their original order so the text still reads
+    naturally.
+    """
+
+    def __init__(self, counter, total_budget: int):
+        self.counter = counter
+        self.total_budget = total_budget
+
+    def _fill(self, passages: List[Tuple[str, float]], budget: int, separator: str) -> Tuple[List[str], int]:
+        """Pick passages by descending score until the budget is spent"""
+        sep_tokens = self.counter.count(separator)
+        order = sorted(range(len(passages)), key=lambda i: passages[i][1], reverse=True)
+
+        chosen = {}
+        used = 0
+        for i in order:
+            text = passages[i][0]
+            cost = self.counter.count(text) + sep_tokens
+            if used + cost <= budget:
+                chosen[i] = text
+                used += cost
+            elif budget - used - sep_tokens >= MIN_PARTIAL_TOKENS:
+                # Use the remaining room for a truncated copy rather than leaving it empty
+                partial = self.counter.truncate(text, budget - used - sep_tokens)
+                chosen[i] = partial
+                used += self.counter.count(partial) + sep_tokens
+                break
+
+        return [chosen[i] for i in sorted(chosen)], used
+
+    def build(self, template: str, blocks: Dict[str, List[Tuple[str, float]]],
+              budgets: Dict[str, Optional[int]], separators: Optional[Dict[str, str]] = None) -> str:
+        """
+        Render template with each {block} filled from its scored passages.
+
+        Args:
+            template: str.format template; literal braces must be doubled
+            blocks: block name -> list of (passage, score), higher score first to be kept
+            budgets: block name -> token budget, or None for the block that takes the remainder
+            separators: block name -> string joining its passages (default newline)
+
+        Returns:
+            The rendered prompt
+        """
+        separators = separators or {}
+        instructions_tokens = self.counter.count(template.format(**{name: "" for name in blocks}))
+        available = max(0, self.total_budget - instructions_tokens)
+
+        filled = {}
+        remainder_block = None
+        for name, passages in blocks.items():
+            if budgets.get(name) is None:
+                remainder_block = name
+                continue
+            budget = min(budgets[name], available)
+            chosen, used = self._fill(passages, budget, separators.get(name, "\n"))
+            filled[name] = chosen
+            available -= used
+
+        if remainder_block is not None:
+            chosen, _ = self._fill(blocks[remainder_block], available, separators.get(remainder_block, "\n"))
+            filled[remainder_block] = chosen
+
+        return template.format(**{
+            name: separators.get(name, "\n").join(chosen) for name, chosen in filled.items()
+        })
@@ -3,36 +3,142 @@ RAG System Helper - Integrates the RAG analysis with Streamlit
 """
 import os
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
-from groq import Groq
+from groq import Groq, AsyncGroq
+import asyncio
+import atexit
 import json
+import queue
+import re
 import time
 import hashlib
-from typing import Dict, List, Optional
+import unicodedata
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
 import sqlite3
+import numpy as np
+import threading
+from collections import OrderedDict
+from utils.embedding_registry import get_registry
+from utils.text_cache import load_contract_text, stream_pdf_pages
+from utils.prompt_builder import PromptBuilder, split_passages, keyword_scores
+from utils.rate_limiter import TokenBucketLimiter
+from utils.token_counter import TokenCounter
+from utils.vector_index import (build_manifest, build_source_manifest, read_manifest, write_manifest,
+                                manifest_matches, sync_faiss_index, index_version)
 
 load_dotenv()
 
+RATE_LIMIT_MESSAGE = "❌ Unable to process due to API rate limits. Please try again in a few minutes."
+
+# Bump whenever ANALYSIS_PROMPT or the result parsing changes so cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = "2"
+
+ANALYSIS_PROMPT = """Analyze this contract for compliance issues ONLY.
+
+Compliance Standards:
+{standards}
+
+Contract Text:
+{contract}
+
+Return ONLY valid JSON (no markdown, no extra text):
+{{"key_clauses": ["clause1", "clause2"], "compliance_issues": [{{"title": "Issue Title", "risk_level": "High/Medium/Low", "reason": "Brief reason"}}]}}"""
+
+CHATBOT_PROMPT = """You are a compliance advisor. Answer briefly:
+Question: {question}
+Contract: {contract}
+Standards: {standards}
+Answer:"""
+
+def contract_fingerprint(contract_text: str) -> str:
+    """Hash of the normalized contract text, stable across whitespace and Unicode form differences"""
+    normalized = unicodedata.normalize("NFKC", contract_text)
+    normalized = re.sub(r'\s+', ' ', normalized).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def _flush_at_exit(cache_ref):
+    cache = cache_ref()
+    if cache is not None:
+        cache.flush()
+
 class ResponseCache:
-    """Simple cache for API responses using SQLite"""
-    def __init__(self, db_path="response_cache.db"):
+    """
+    Bounded cache for API responses: SQLite on disk with an in-process L1 dict.
+    
+    Entries expire after a per-entry TTL, and the table is kept under
+    max_rows / max_bytes by evicting least recently (lru) or least
+    frequently (lfu) used entries. Each thread keeps one long-lived WAL
+    connection, and writes are buffered and flushed in batches;
+    write_through=True flushes every set() at once, for long-lived
+    processes that may be killed before they exit cleanly.
+    """
+    def __init__(self, db_path="response_cache.db", max_rows: int = 5000, max_bytes: int = 50 * 1024 * 1024,
+                 default_ttl: Optional[int] = 7 * 24 * 3600, eviction: str = "lru", l1_size: int = 256,
+                 evict_every: int = 20, write_batch_size: int = 16, flush_interval: float = 2.0,
+                 write_through: bool = False):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {eviction}")
         self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.eviction = eviction
+        self.l1_size = l1_size
+        self.evict_every = evict_every
+        self.write_batch_size = write_batch_size
+        self.flush_interval = flush_interval
+        self.write_through = write_through
+        self._l1 = OrderedDict()  # key -> (response, expires_at)
+        self._l1_lock = threading.Lock()
+        self._local = threading.local()
+        # Buffered writes, flushed together by whichever thread crosses the threshold
+        self._write_lock = threading.Lock()
+        self._pending_sets = {}  # key -> row tuple
+        self._pending_access = {}  # key -> (last_access, hit count)
+        self._pending_deletes = set()
+        self._last_flush = time.time()
+        self._sets_since_evict = 0
         self._init_db()
+        # Through a weak reference, so the exit hook does not keep every cache alive
+        atexit.register(_flush_at_exit, weakref.ref(self))
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Long-lived per-thread connection; identical SQL strings reuse cached prepared statements"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, cached_statements=128)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
     
     def _init_db(self):
-        """Initialize cache database"""
+        """Initialize cache database, migrating tables created before TTL/eviction support"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''CREATE TABLE IF NOT EXISTS cache (
-                    key TEXT PRIMARY KEY,
-                    response TEXT,
-                    timestamp INTEGER,
-                    token_count INTEGER
-                )''')
-                conn.commit()
+            conn = self._connect()
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                timestamp INTEGER,
+                token_count INTEGER
+            )''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(cache)')}
+            for column, ddl in (("expires_at", "INTEGER"), ("last_access", "INTEGER"),
+                                ("hits", "INTEGER DEFAULT 0"), ("size_bytes", "INTEGER DEFAULT 0")):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE cache ADD COLUMN {column} {ddl}')
+            conn.execute('UPDATE cache SET last_access = timestamp WHERE last_access IS NULL')
+            conn.execute('UPDATE cache SET size_bytes = LENGTH(CAST(response AS BLOB)) WHERE size_bytes = 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_timestamp ON cache(timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache(last_access)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_lfu ON cache(hits, last_access)')
+            conn.commit()
+            self._evict(conn)
         except Exception as e:
             print(f"Cache initialization error: {e}")
     
@@ -40,26 +146,327 @@ class ResponseCache:
         """Hash a query for cache key"""
         return hashlib.md5(query.encode()).hexdigest()
     
+    def _l1_get(self, key: str) -> Optional[str]:
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            response, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return response
+    
+    def _l1_put(self, key: str, response: str, expires_at: Optional[int]):
+        if self.l1_size <= 0:
+            return
+        with self._l1_lock:
+            self._l1[key] = (response, expires_at)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+    
+    def _l1_drop(self, keys):
+        with self._l1_lock:
+            for key in keys:
+                self._l1.pop(key, None)
+    
+    def _record_access(self, key: str, now: int):
+        with self._write_lock:
+            _, hits = self._pending_access.get(key, (now, 0))
+            self._pending_access[key] = (now, hits + 1)
+        self._maybe_flush()
+    
     def get(self, query: str) -> Optional[str]:
-        """Get cached response"""
+        """Get cached response, serving hot and not-yet-flushed entries from memory"""
         try:
             key = self._hash_query(query)
-            with sqlite3.connect(self.db_path) as conn:
-                result = conn.execute('SELECT response FROM cache WHERE key = ?', (key,)).fetchone()
-                return result[0] if result else None
+            now = int(time.time())
+            
+            response = self._l1_get(key)
+            if response is None:
+                with self._write_lock:
+                    pending = self._pending_sets.get(key)
+                if pending is not None:
+                    response, expires_at = pending[1], pending[4]
+                    if expires_at is not None and expires_at <= now:
+                        return None
+            if response is not None:
+                self._record_access(key, now)
+                return response
+            
+            result = self._connect().execute('SELECT response, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if not result:
+                return None
+            response, expires_at = result
+            if expires_at is not None and expires_at <= now:
+                with self._write_lock:
+                    self._pending_deletes.add(key)
+                return None
+            
+            self._l1_put(key, response, expires_at)
+            self._record_access(key, now)
+            return response
         except Exception:
             return None
     
-    def set(self, query: str, response: str, token_count: int = 0):
-        """Cache a response"""
+    def set(self, query: str, response: str, token_count: int = 0, ttl: Optional[int] = None):
+        """Cache a response; ttl overrides default_ttl (None = default, 0 = never expire)"""
         try:
             key = self._hash_query(query)
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('INSERT OR REPLACE INTO cache (key, response, timestamp, token_count) VALUES (?, ?, ?, ?)',
-                            (key, response, int(time.time()), token_count))
-                conn.commit()
+            now = int(time.time())
+            ttl = self.default_ttl if ttl is None else ttl
+            expires_at = now + ttl if ttl else None
+            size_bytes = len(response.encode())
+            
+            with self._write_lock:
+                self._pending_sets[key] = (key, response, now, token_count, expires_at, now, size_bytes)
+                self._pending_deletes.discard(key)
+                self._pending_access.pop(key, None)
+            self._l1_put(key, response, expires_at)
+            if self.write_through:
+                self.flush()
+            else:
+                self._maybe_flush()
         except Exception as e:
             print(f"Cache set error: {e}")
+    
+    def _maybe_flush(self):
+        with self._write_lock:
+            pending = len(self._pending_sets) + len(self._pending_access) + len(self._pending_deletes)
+            due = pending >= self.write_batch_size or (pending and time.time() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """Write all buffered inserts, access stats and deletes in one transaction"""
+        with self._write_lock:
+            sets = list(self._pending_sets.values())
+            access = [(last, hits, key) for key, (last, hits) in self._pending_access.items()]
+            deletes = [(key,) for key in self._pending_deletes]
+            self._pending_sets.clear()
+            self._pending_access.clear()
+            self._pending_deletes.clear()
+            self._last_flush = time.time()
+        
+        if not (sets or access or deletes):
+            return
+        
+        try:
+            conn = self._connect()
+            with conn:
+                if sets:
+                    conn.executemany('''INSERT OR REPLACE INTO cache
+                                        (key, response, timestamp, token_count, expires_at, last_access, hits, size_bytes)
+                                        VALUES (?, ?, ?, ?, ?, ?, 0, ?)''', sets)
+                if access:
+                    conn.executemany('UPDATE cache SET last_access = ?, hits = hits + ? WHERE key = ?', access)
+                if deletes:
+                    conn.executemany('DELETE FROM cache WHERE key = ?', deletes)
+            
+            self._sets_since_evict += len(sets)
+            if self._sets_since_evict >= self.evict_every:
+                self._evict(conn)
+        except Exception as e:
+            print(f"Cache flush error: {e}")
+    
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries, then evict by policy until within max_rows / max_bytes"""
+        self._sets_since_evict = 0
+        now = int(time.time())
+        
+        expired = [row[0] for row in conn.execute(
+            'SELECT key FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,))]
+        if expired:
+            conn.executemany('DELETE FROM cache WHERE key = ?', [(k,) for k in expired])
+            self._l1_drop(expired)
+        
+        count, total_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM cache').fetchone()
+        if count > self.max_rows or total_bytes > self.max_bytes:
+            order = "last_access ASC" if self.eviction == "lru" else "hits ASC, last_access ASC"
+            victims = []
+            for key, size_bytes in conn.execute(f'SELECT key, size_bytes FROM cache ORDER BY {order}'):
+                if count <= self.max_rows and total_bytes <= self.max_bytes:
+                    break
+                victims.append(key)
+                count -= 1
+                total_bytes -= size_bytes or 0
+            conn.executemany('DELETE FROM cache WHERE key = ?', [(k,) for k in victims])
+            self._l1_drop(victims)
+        
+        conn.commit()
+    
+    def clear(self):
+        """Remove every cached response"""
+        with self._write_lock:
+            self._pending_sets.clear()
+            self._pending_access.clear()
+            self._pending_deletes.clear()
+        with self._l1_lock:
+            self._l1.clear()
+        conn = self._connect()
+        conn.execute('DELETE FROM cache')
+        conn.commit()
+
+# Words that never change what a question asks
+QUESTION_STOPWORDS = frozenset("""
+a an the is are was were be been being do does did can could would should will shall may might must
+what whats which who whom whose when where why how this that these those it its of in on at to for by
+from about as and or if there their they them i me my we our you your please tell explain
+""".split())
+
+# Words whose difference always changes the answer: negations and the contract's parties
+QUESTION_NEGATIONS = frozenset("not no never without nor neither none except unless".split())
+QUESTION_PARTIES = frozenset("""
+employer employee landlord tenant lessor lessee buyer seller purchaser vendor supplier customer client
+contractor subcontractor consultant licensor licensee provider company party
+""".split())
+
+# Words a paraphrase adds or drops without asking something else
+QUESTION_FILLER = frozenset("""
+long much many allowed permitted able entitled possible mean say state specify mention describe
+contract agreement clause section provision term exactly actually currently under per any
+""".split())
+
+# Common rewordings mapped to one form before comparing
+QUESTION_SYNONYMS = {
+    "cannot": "not", "termination": "terminate", "end": "terminate", "cancel": "terminate",
+    "cancellation": "terminate", "fire": "terminate", "dismiss": "terminate", "payment": "pay",
+    "salary": "pay", "wage": "pay", "compensation": "pay", "duration": "period", "length": "period",
+    "confidentiality": "confidential", "liable": "liability",
+}
+
+
+def question_terms(question: str) -> frozenset:
+    """Content words of a question, plural-insensitive and with common rewordings merged"""
+    text = question.lower().replace("\u2019", "'").replace("n't", " not").replace("'", "")
+    terms = set()
+    for w in re.findall(r"[a-z0-9]+", text):
+        if w in QUESTION_STOPWORDS:
+            continue
+        if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        terms.add(QUESTION_SYNONYMS.get(w, w))
+    return frozenset(terms)
+
+
+def questions_conflict(terms_a: frozenset, terms_b: frozenset) -> bool:
+    """
+    True if two similar-sounding questions ask different things.
+    
+    Only words present in one question count, and filler does not:
+    negations, parties and any other content word do.
+    """
+    return any(w in QUESTION_NEGATIONS or w in QUESTION_PARTIES or w not in QUESTION_FILLER
+               for w in terms_a ^ terms_b)
+
+class SemanticCache:
+    """
+    Finds earlier questions about the same contract that mean the same thing.
+    
+    Question embeddings live in the ResponseCache database next to the
+    responses they point at; a lookup is one matrix-vector product over
+    the questions already asked about that contract. Embeddings alone
+    score "with"/"without notice" or "employer"/"employee" as
+    near-identical, so a candidate is also vetoed when the two questions
+    differ in a negation, a party or another content word.
+    """
+    def __init__(self, response_cache: ResponseCache, threshold: float = 0.95, max_per_contract: int = 200):
+        self.response_cache = response_cache
+        self.threshold = threshold
+        self.max_per_contract = max_per_contract
+        self._matrices = {}  # contract fingerprint -> (cache keys, question terms, normalized embedding matrix)
+        self._lock = threading.Lock()
+        self._init_db()
+    
+    def _init_db(self):
+        """Initialize semantic cache table"""
+        try:
+            conn = self.response_cache._connect()
+            conn.execute('''CREATE TABLE IF NOT EXISTS semantic_cache (
+                contract_fp TEXT,
+                cache_key TEXT,
+                embedding BLOB,
+                timestamp INTEGER,
+                question TEXT,
+                PRIMARY KEY (contract_fp, cache_key)
+            )''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(semantic_cache)')}
+            if 'question' not in columns:
+                # Older rows have no question text and can never pass the lexical check
+                conn.execute('ALTER TABLE semantic_cache ADD COLUMN question TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_semantic_contract ON semantic_cache(contract_fp, timestamp)')
+            conn.commit()
+        except Exception as e:
+            print(f"Semantic cache initialization error: {e}")
+    
+    @staticmethod
+    def embed(embeddings, question: str) -> np.ndarray:
+        """Unit-length float32 embedding of a question"""
+        vector = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def _load(self, contract_fp: str):
+        with self._lock:
+            if contract_fp in self._matrices:
+                return self._matrices[contract_fp]
+        rows = self.response_cache._connect().execute(
+            'SELECT cache_key, embedding, question FROM semantic_cache WHERE contract_fp = ? '
+            'ORDER BY timestamp DESC LIMIT ?',
+            (contract_fp, self.max_per_contract)
+        ).fetchall()
+        keys = [row[0] for row in rows]
+        terms = [question_terms(row[2]) if row[2] is not None else None for row in rows]
+        matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+        with self._lock:
+            self._matrices[contract_fp] = (keys, terms, matrix)
+        return keys, terms, matrix
+    
+    def lookup(self, contract_fp: str, question: str, question_embedding: np.ndarray) -> Optional[str]:
+        """
+        Cached answer to an earlier question that means the same thing, if any.
+        
+        Candidates above the threshold are tried best first, so a top match
+        whose response was evicted falls through to the next one.
+        """
+        try:
+            keys, terms, matrix = self._load(contract_fp)
+            if matrix is None:
+                return None
+            similarities = matrix @ question_embedding
+            wanted = question_terms(question)
+            for i in np.argsort(-similarities):
+                if similarities[i] < self.threshold:
+                    break
+                if terms[i] is None or questions_conflict(terms[i], wanted):
+                    continue
+                response = self.response_cache.get(keys[i])
+                if response:
+                    return response
+            return None
+        except Exception:
+            return None
+    
+    def add(self, contract_fp: str, question: str, question_embedding: np.ndarray, cache_key: str):
+        """Remember a question so paraphrases of it can reuse its answer"""
+        try:
+            conn = self.response_cache._connect()
+            conn.execute('INSERT OR REPLACE INTO semantic_cache (contract_fp, cache_key, embedding, timestamp, question) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         (contract_fp, cache_key, question_embedding.astype(np.float32).tobytes(), int(time.time()),
+                          question))
+            # Keep only the most recent questions per contract
+            conn.execute('''DELETE FROM semantic_cache WHERE contract_fp = ? AND cache_key NOT IN (
+                                SELECT cache_key FROM semantic_cache WHERE contract_fp = ?
+                                ORDER BY timestamp DESC LIMIT ?)''',
+                         (contract_fp, contract_fp, self.max_per_contract))
+            conn.commit()
+            with self._lock:
+                self._matrices.pop(contract_fp, None)
+        except Exception as e:
+            print(f"Semantic cache set error: {e}")
 
 class RAGAnalyzer:
     def __init__(self, compliance_pdf="scraped_data.pdf", vector_db_path="faiss_index"):
@@ -68,199 +475,620 @@ class RAGAnalyzer:
         self.vector_db_path = vector_db_path
         self.client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
         self.vectorstore = None
+        self.index_version = "none"
         self.embeddings = None
+        self.embedding_model_name = get_registry().resolve("sentence-transformers/all-MiniLM-L6-v2")
+        self.chunk_size = 800
+        self.chunk_overlap = 200
         self.cache = ResponseCache()
-        self.rate_limit_retry_count = 2  # Reduced from 3 to 2
-        self.rate_limit_backoff = 10  # Increased from 5 to 10 seconds
+        self.semantic_cache = SemanticCache(self.cache)
+        self.rate_limiter = TokenBucketLimiter()
+        self.token_counter = TokenCounter()
+        self.max_request_tokens = 3000  # Prompt + completion safety threshold per request
+        self.standards_token_budget = 500  # Share of each prompt reserved for retrieved standards
+        self.analysis_model = "llama-3.1-8b-instant"
+        # Per-contract indexes for chatbot retrieval, cached on disk by content hash
+        self.contract_index_dir = "contract_indexes"
+        self.contract_chunk_size = 600
+        self.contract_chunk_overlap = 100
+        self.max_loaded_contract_indexes = 8
+        self._contract_indexes = OrderedDict()
+        self._contract_index_lock = threading.Lock()
+        self.analysis_cache_ttl = 30 * 24 * 3600
+        self.max_rate_limit_wait = 30  # Longer than this and we switch to the fallback model
+        # Map-reduce sections queue through the per-minute quotas, but give up (and leave the
+        # analysis incomplete, to be resumed later) rather than book hours against a spent daily quota
+        self.max_daily_quota_wait = 60
+        # Map-reduce analysis of long contracts
+        self.section_chars = 6000  # Contracts up to this size go out as a single request
+        self.section_overlap = 300
+        self.max_concurrent_requests = 4  # In-flight Groq requests on the async path
+        # Estimated prompt + completion tokens per full analysis: about 45 sections of section_chars,
+        # i.e. ~260k characters or ~80 pages. Sections past it are skipped and the result is
+        # flagged "truncated"
+        self.analysis_token_budget = 120000
         
     def _estimate_tokens(self, text: str) -> int:
-        """Rough estimate of tokens (1 token ≈ 4 characters)"""
-        return len(text) // 4
+        """Token count from the tokenizer-backed counter"""
+        return self.token_counter.count(text)
     
     def _call_groq_with_fallback(self, prompt: str, max_tokens: int = 400, model: str = "llama-3.1-8b-instant") -> str:
-        """Call Groq with automatic fallback and retry logic - optimized for speed"""
+        """Call Groq with proactive rate limiting and automatic model fallback"""
+        
+        # Use fast model by default for quicker responses; no second try of the same model
+        models_to_try = list(dict.fromkeys([model, "llama-3.1-8b-instant"]))
+        
+        for attempt_model in models_to_try:
+            # Reserve quota up front instead of waiting for a 429
+            estimated_tokens = self._estimate_tokens(prompt) + max_tokens
+            if not self.rate_limiter.acquire(attempt_model, estimated_tokens, max_wait=self.max_rate_limit_wait):
+                print(f"⚠️ {attempt_model} quota exhausted. Trying fallback model...")
+                continue
+            
+            try:
+                response = self.client.chat.completions.create(
+                    model=attempt_model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=0.3,
+                    top_p=1
+                )
+                self._record_usage(attempt_model, estimated_tokens, response)
+                return response.choices[0].message.content
+                
+            except Exception as e:
+                error_str = str(e)
+                
+                # Quota is shared with other clients of the same key, so a 429 is still possible
+                if "429" in error_str or "rate_limit" in error_str.lower():
+                    self.rate_limiter.penalize(attempt_model)
+                    print(f"⚠️ Rate limit hit on {attempt_model}. Trying fallback model...")
+                    continue
+                raise e
+        
+        # Final fallback response
+        return RATE_LIMIT_MESSAGE
+    
+    def _record_usage(self, model: str, estimated_tokens: int, response):
+        """Record the real token usage and feed it back into the rate limiter"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        entry = self.token_counter.record_usage(model, usage)
+        if entry["total_tokens"]:
+            self.rate_limiter.reconcile(model, estimated_tokens, entry["total_tokens"])
+    
+    def get_usage_summary(self) -> Dict[str, Dict]:
+        """Actual token spend per model since this analyzer was created"""
+        return self.token_counter.usage_summary()
+    
+    def _stream_groq_with_fallback(self, prompt: str, max_tokens: int = 400,
+                                   model: str = "llama-3.1-8b-instant") -> Iterator[str]:
+        """Streaming variant of _call_groq_with_fallback that yields text as it is generated"""
+        models_to_try = list(dict.fromkeys([model, "llama-3.1-8b-instant"]))
         
-        # Estimate tokens to avoid hitting limits
-        estimated_prompt_tokens = self._estimate_tokens(prompt)
-        if estimated_prompt_tokens + max_tokens > 3000:  # Safety threshold
-            # Reduce context if needed
-            prompt = self._reduce_prompt_size(prompt)
+        for attempt_model in models_to_try:
+            estimated_tokens = self._estimate_tokens(prompt) + max_tokens
+            if not self.rate_limiter.acquire(attempt_model, estimated_tokens, max_wait=self.max_rate_limit_wait):
+                print(f"⚠️ {attempt_model} quota exhausted. Trying fallback model...")
+                continue
+            
+            yielded = False
+            try:
+                stream = self.client.chat.completions.create(
+                    model=attempt_model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=0.3,
+                    top_p=1,
+                    stream=True
+                )
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yielded = True
+                        yield chunk.choices[0].delta.content
+                    # Groq reports usage on the final chunk under x_groq
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                        self._record_usage(attempt_model, estimated_tokens, x_groq)
+                return
+                
+            except Exception as e:
+                error_str = str(e)
+                
+                # Only fall back if nothing reached the caller yet
+                if not yielded and ("429" in error_str or "rate_limit" in error_str.lower()):
+                    self.rate_limiter.penalize(attempt_model)
+                    print(f"⚠️ Rate limit hit on {attempt_model}. Trying fallback model...")
+                    continue
+                raise e
+        
+        yield RATE_LIMIT_MESSAGE
+    
+    async def _acall_groq_with_fallback(self, client: AsyncGroq, semaphore: asyncio.Semaphore, prompt: str,
+                                        max_tokens: int = 400, model: str = "llama-3.1-8b-instant") -> str:
+        """Async counterpart of _call_groq_with_fallback; the semaphore bounds in-flight requests"""
         
-        # Use fast model by default for quicker responses
-        models_to_try = [model, "llama-3.1-8b-instant"]
+        models_to_try = list(dict.fromkeys([model, "llama-3.1-8b-instant"]))
         
         for attempt_model in models_to_try:
-            for retry in range(self.rate_limit_retry_count):
-                try:
-                    response = self.client.chat.completions.create(
+            estimated_tokens = self._estimate_tokens(prompt) + max_tokens
+            # Map-reduce sections queue on the last model rather than give up on a busy minute
+            max_wait = self.max_rate_limit_wait if attempt_model != models_to_try[-1] else None
+            if not await self.rate_limiter.aacquire(attempt_model, estimated_tokens, max_wait=max_wait,
+                                                    max_daily_wait=self.max_daily_quota_wait):
+                print(f"⚠️ {attempt_model} quota exhausted. Trying fallback model...")
+                continue
+            
+            try:
+                async with semaphore:
+                    response = await client.chat.completions.create(
                         model=attempt_model,
                         messages=[{"role": "user", "content": prompt}],
                         max_tokens=max_tokens,
                         temperature=0.3,
                         top_p=1
                     )
-                    return response.choices[0].message.content
-                    
-                except Exception as e:
-                    error_str = str(e)
-                    
-                    # Handle rate limit (429)
-                    if "429" in error_str or "rate_limit" in error_str.lower():
-                        # If second attempt fails, don't retry - switch to fallback
-                        if retry >= 1:
-                            print(f"⚠️ Rate limit persists. Trying fallback model...")
-                            break
-                        
-                        wait_time = 10  # Fixed 10 second wait
-                        print(f"⚠️ Rate limit hit. Waiting {wait_time}s...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        raise e
+                self._record_usage(attempt_model, estimated_tokens, response)
+                return response.choices[0].message.content
+                
+            except Exception as e:
+                error_str = str(e)
+                
+                if "429" in error_str or "rate_limit" in error_str.lower():
+                    self.rate_limiter.penalize(attempt_model)
+                    print(f"⚠️ Rate limit hit on {attempt_model}. Trying fallback model...")
+                    continue
+                raise e
         
-        # Final fallback response
-        return "❌ Unable to process due to API rate limits. Please try again in a few minutes."
+        return RATE_LIMIT_MESSAGE
     
-    def _reduce_prompt_size(self, prompt: str) -> str:
-        """Reduce prompt size by truncating context"""
-        lines = prompt.split('\n')
+    async def acall_groq_many(self, prompts: List[str], max_tokens: int = 400, model: str = "llama-3.1-8b-instant",
+                              client: Optional[AsyncGroq] = None, semaphore: Optional[asyncio.Semaphore] = None,
+                              on_done: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """
+        Send several prompts concurrently, at most max_concurrent_requests at a time.
+        
+        on_done(completed, total) is called as each response arrives.
+        """
+        if client is None:
+            async with AsyncGroq(api_key=os.environ.get("GROQ_API_KEY")) as client:
+                return await self.acall_groq_many(prompts, max_tokens, model, client, semaphore, on_done)
         
-        # Find sections and truncate
-        new_prompt = []
-        for line in lines:
-            if 'Context' in line or 'Contract' in line or 'Compliance' in line:
-                # Keep headers but reduce content
-                new_prompt.append(line)
-            elif len('\n'.join(new_prompt)) < 2000:  # Keep under 2000 chars
-                new_prompt.append(line)
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrent_requests)
+        completed = 0
         
-        return '\n'.join(new_prompt)
+        async def call(prompt):
+            nonlocal completed
+            response = await self._acall_groq_with_fallback(client, semaphore, prompt, max_tokens, model)
+            completed += 1
+            if on_done:
+                on_done(completed, len(prompts))
+            return response
+        
+        return await asyncio.gather(*[call(prompt) for prompt in prompts])
+    
+    def _run_async(self, coro):
+        """Run a coroutine from sync code, even if this thread already has a running loop"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coro)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coro).result()
+    
+    def _prompt_budget(self, max_tokens: int) -> int:
+        """Prompt tokens available once the completion is reserved"""
+        return self.max_request_tokens - max_tokens
+    
+    def _retrieve_standards(self, query: str, k: int = 4) -> List[tuple]:
+        """Retrieve compliance passages as (text, score) pairs, higher score = more relevant"""
+        results = self.vectorstore.similarity_search_with_score(query, k=k)
+        # FAISS returns L2 distances, so negate them into scores
+        return [(doc.page_content, -float(distance)) for doc, distance in results]
         
-    def load_compliance_data(self):
-        """Load compliance dataset"""
+    def load_compliance_data(self) -> Iterator[Document]:
+        """Stream the compliance dataset one page Document at a time"""
         if not os.path.exists(self.compliance_pdf):
             raise FileNotFoundError(f"Compliance PDF not found: {self.compliance_pdf}")
         
-        loader = PyPDFLoader(self.compliance_pdf)
-        documents = loader.load()
-        return documents
+        for page_number, text in enumerate(stream_pdf_pages(self.compliance_pdf)):
+            yield Document(page_content=text, metadata={"source": self.compliance_pdf, "page": page_number})
     
     def split_documents(self, documents):
-        """Split documents into chunks"""
-        splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200)
-        chunks = splitter.split_documents(documents)
+        """Split documents into chunks, one page at a time so only the chunks are held"""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        chunks = []
+        for document in documents:
+            chunks.extend(splitter.split_documents([document]))
         return chunks
     
-    def create_vector_store(self, chunks):
-        """Create or load FAISS vector store"""
-        if os.path.exists(self.vector_db_path):
-            self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-            self.vectorstore = FAISS.load_local(self.vector_db_path, self.embeddings, allow_dangerous_deserialization=True)
-        else:
-            self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-            self.vectorstore = FAISS.from_documents(chunks, self.embeddings)
-            self.vectorstore.save_local(self.vector_db_path)
-        
+    def _expected_manifest(self) -> Dict:
+        """Manifest describing the index the current source PDF and settings would produce"""
+        return build_manifest(self.compliance_pdf, self.chunk_size, self.chunk_overlap, self.embedding_model_name)
+    
+    def _get_embeddings(self):
+        """Lazily acquire the shared embedding model from the process registry"""
+        if self.embeddings is None:
+            self.embeddings = get_registry().acquire(self.embedding_model_name)
+        return self.embeddings
+    
+    def close(self):
+        """Release the shared embedding model held by this analyzer"""
+        if self.embeddings is not None:
+            get_registry().release(self.embedding_model_name)
+            self.embeddings = None
+            self.vectorstore = None
+    
+    def load_vector_store(self):
+        """Load the persisted FAISS index without touching the source PDF"""
+        self.vectorstore = FAISS.load_local(self.vector_db_path, self._get_embeddings(), allow_dangerous_deserialization=True)
+        self.index_version = index_version(read_manifest(self.vector_db_path))
+        return self.vectorstore
+    
+    def create_vector_store(self, chunks, manifest: Optional[Dict] = None):
+        """Create, incrementally update or load the FAISS vector store"""
+        manifest = manifest or self._expected_manifest()
+        self.vectorstore, _ = sync_faiss_index(self.vector_db_path, chunks, self._get_embeddings(), manifest)
+        self.index_version = index_version(read_manifest(self.vector_db_path))
         return self.vectorstore
     
     def setup(self):
         """Complete setup: load compliance, create chunks, and vector store"""
-        documents = self.load_compliance_data()
-        chunks = self.split_documents(documents)
-        self.create_vector_store(chunks)
+        if not os.path.exists(self.compliance_pdf):
+            raise FileNotFoundError(f"Compliance PDF not found: {self.compliance_pdf}")
+        
+        # Skip parsing and splitting entirely when the persisted index is current
+        manifest = self._expected_manifest()
+        if os.path.exists(self.vector_db_path) and manifest_matches(read_manifest(self.vector_db_path), manifest):
+            self.load_vector_store()
+            return
+        
+        chunks = self.split_documents(self.load_compliance_data())
+        self.create_vector_store(chunks, manifest)
+    
+    def get_contract_index(self, contract_text: str):
+        """
+        FAISS index over one contract's passages.
+        
+        Built once per contract version and saved under contract_index_dir
+        by content hash; later calls load it from memory or disk.
+        """
+        contract_fp = contract_fingerprint(contract_text)
+        with self._contract_index_lock:
+            if contract_fp in self._contract_indexes:
+                self._contract_indexes.move_to_end(contract_fp)
+                return self._contract_indexes[contract_fp]
+        
+        index_path = os.path.join(self.contract_index_dir, contract_fp)
+        manifest = build_source_manifest(contract_fp, self.contract_chunk_size, self.contract_chunk_overlap,
+                                         self.embedding_model_name)
+        
+        if os.path.exists(index_path) and manifest_matches(read_manifest(index_path), manifest):
+            index = FAISS.load_local(index_path, self._get_embeddings(), allow_dangerous_deserialization=True)
+        else:
+            splitter = RecursiveCharacterTextSplitter(chunk_size=self.contract_chunk_size,
+                                                      chunk_overlap=self.contract_chunk_overlap)
+            passages = [p for p in splitter.split_text(contract_text) if p.strip()] or [contract_text]
+            index = FAISS.from_texts(passages, self._get_embeddings(),
+                                     metadatas=[{"passage": i} for i in range(len(passages))])
+            index.save_local(index_path)
+            write_manifest(index_path, manifest)
+        
+        with self._contract_index_lock:
+            self._contract_indexes[contract_fp] = index
+            while len(self._contract_indexes) > self.max_loaded_contract_indexes:
+                self._contract_indexes.popitem(last=False)
+        return index
+    
+    def _retrieve_contract_passages(self, contract_text: str, query: str, k: int = 6) -> List[tuple]:
+        """Contract passages that best answer query, as (text, score) pairs"""
+        try:
+            results = self.get_contract_index(contract_text).similarity_search_with_score(query, k=k)
+            return [(doc.page_content, -float(distance)) for doc, distance in results]
+        except Exception as e:
+            print(f"Contract index unavailable, falling back to keyword matching: {e}")
+            return keyword_scores(split_passages(contract_text), query)
     
     def load_contract(self, contract_path):
         """Load contract from PDF or text file"""
-        if contract_path.lower().endswith(".pdf"):
-            loader = PyPDFLoader(contract_path)
-            docs = loader.load()
-            contract_text = " ".join([doc.page_content for doc in docs])
+        return load_contract_text(contract_path)
+    
+    def split_contract(self, contract_text: str) -> List[str]:
+        """Split a contract into overlapping sections for map-reduce analysis"""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=self.section_chars, chunk_overlap=self.section_overlap)
+        return [section for section in splitter.split_text(contract_text) if section.strip()]
+    
+    def _build_analysis_prompt(self, section_text: str, max_tokens: int = 500) -> str:
+        """Retrieve standards relevant to one contract section and pack its prompt"""
+        builder = PromptBuilder(self.token_counter, self._prompt_budget(max_tokens))
+        # Contract passages keep document order as their priority
+        passages = split_passages(section_text)
+        return builder.build(
+            ANALYSIS_PROMPT,
+            {
+                "standards": self._retrieve_standards(section_text[:1000]),
+                "contract": [(p, -i) for i, p in enumerate(passages)]
+            },
+            {"standards": self.standards_token_budget, "contract": None},
+            {"standards": "\n", "contract": "\n\n"}
+        )
+    
+    def _parse_analysis(self, result_text: str) -> Optional[Dict]:
+        """Pull the JSON analysis out of a model response; None if there is none to parse"""
+        try:
+            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
+            if not json_match:
+                return None
+            result = json.loads(json_match.group())
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(result, dict):
+            return None
+        
+        return {
+            "key_clauses": result.get("key_clauses", [])[:10],  # Limit to 10
+            "compliance_issues": result.get("compliance_issues", [])[:8]  # Limit to 8
+        }
+    
+    def _merge_analyses(self, results: List[Dict]) -> Dict:
+        """Reduce per-section results into one analysis, deduplicating clauses and issues"""
+        risk_rank = {"High": 0, "Medium": 1, "Low": 2}
+        
+        def normalize(text) -> str:
+            return re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).strip()
+        
+        clauses = {}
+        for result in results:
+            for clause in result.get("key_clauses", []):
+                clauses.setdefault(normalize(clause), clause)
+        
+        issues = {}
+        for result in results:
+            for issue in result.get("compliance_issues", []):
+                if not isinstance(issue, dict):
+                    continue
+                key = normalize(issue.get("title", ""))
+                existing = issues.get(key)
+                # The same issue raised by several sections keeps its most severe rating
+                if existing is None or risk_rank.get(issue.get("risk_level"), 3) < risk_rank.get(existing.get("risk_level"), 3):
+                    issues[key] = issue
+        
+        merged_issues = sorted(issues.values(), key=lambda i: risk_rank.get(i.get("risk_level"), 3))
+        
+        return {
+            "key_clauses": list(clauses.values())[:30],
+            "compliance_issues": merged_issues[:20]
+        }
+    
+    def _plan_analysis(self, contract_text: str):
+        """Split the contract and build section prompts that fit the token budget"""
+        if len(contract_text) <= self.section_chars:
+            return [self._build_analysis_prompt(contract_text)], 1
+        
+        sections = self.split_contract(contract_text)
+        
+        # Build every prompt up front so the token budget is applied before any call
+        prompts = []
+        spent = 0
+        for section in sections:
+            prompt = self._build_analysis_prompt(section)
+            cost = self._estimate_tokens(prompt) + 500
+            if prompts and spent + cost > self.analysis_token_budget:
+                break
+            prompts.append(prompt)
+            spent += cost
+        
+        return prompts, len(sections)
+    
+    def _finish_analysis(self, responses: List[str], sections_total: int) -> Dict:
+        """Reduce section responses into the final analysis result"""
+        # Rate-limited sections and unparseable model output both come back as None
+        results = [self._parse_analysis(r) if r != RATE_LIMIT_MESSAGE else None for r in responses]
+        parsed = [r for r in results if r is not None]
+        if sections_total == 1:
+            analysis_result = parsed[0] if parsed else {"key_clauses": [], "compliance_issues": []}
         else:
-            loader = TextLoader(contract_path)
-            docs = loader.load()
-            contract_text = " ".join([doc.page_content for doc in docs])
+            analysis_result = self._merge_analyses(parsed)
+            analysis_result["coverage"] = {
+                "sections_total": sections_total,
+                "sections_analyzed": len(parsed)
+            }
         
-        return contract_text
+        # Some sections were never analyzed; callers may want to retry later
+        if len(parsed) < len(responses):
+            analysis_result["incomplete"] = True
+        # The token budget stopped planning before the last sections; a retry would stop there too
+        if len(responses) < sections_total:
+            analysis_result["truncated"] = True
+        return analysis_result
+    
+    def _analysis_cache_key(self, contract_text: str) -> str:
+        """Cache key covering everything a full analysis result depends on"""
+        return (f"analysis:{contract_fingerprint(contract_text)}:v{ANALYSIS_PROMPT_VERSION}"
+                f":{self.analysis_model}:{self.index_version}")
+    
+    def _get_cached_analysis(self, cache_key: str) -> Optional[Dict]:
+        cached = self.cache.get(cache_key)
+        if not cached:
+            return None
+        try:
+            return dict(json.loads(cached), cached=True)
+        except json.JSONDecodeError:
+            return None
+    
+    def _cache_analysis(self, cache_key: str, analysis_result: Dict):
+        """Cache a finished analysis only if every section was analyzed, so a retry can fill the gaps"""
+        if analysis_result.get("incomplete") or analysis_result.get("truncated"):
+            return
+        self.cache.set(cache_key, json.dumps(analysis_result), ttl=self.analysis_cache_ttl)
+    
+    async def aanalyze_contract(self, contract_text, client: Optional[AsyncGroq] = None,
+                                semaphore: Optional[asyncio.Semaphore] = None,
+                                on_section_done: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Async map-reduce analysis.
+        
+        Pass a shared client and semaphore to bound concurrency across
+        several contracts analyzed at once; on_section_done(done, total)
+        reports progress.
+        """
+        cache_key = self._analysis_cache_key(contract_text)
+        cached = self._get_cached_analysis(cache_key)
+        if cached is not None:
+            return cached
+        
+        try:
+            # Retrieval is CPU-bound; keep it off the event loop
+            prompts, sections_total = await asyncio.to_thread(self._plan_analysis, contract_text)
+            responses = await self.acall_groq_many(prompts, max_tokens=500, model=self.analysis_model,
+                                                   client=client, semaphore=semaphore, on_done=on_section_done)
+            analysis_result = self._finish_analysis(responses, sections_total)
+            self._cache_analysis(cache_key, analysis_result)
+            return analysis_result
+        except Exception as e:
+            print(f"Error analyzing contract: {str(e)}")
+            return {"key_clauses": [], "compliance_issues": [], "error": str(e)}
     
     def analyze_contract(self, contract_text):
-        """Analyze contract for compliance issues - optimized for rate limits"""
-        import re
+        """Analyze the full contract, map-reducing over sections when it is long"""
+        if len(contract_text) > self.section_chars:
+            return self._run_async(self.aanalyze_contract(contract_text))
         
-        # Use ONLY FIRST 6000 chars to minimize API calls (single request)
-        contract_text = contract_text[:6000]
+        cache_key = self._analysis_cache_key(contract_text)
+        cached = self._get_cached_analysis(cache_key)
+        if cached is not None:
+            return cached
         
         try:
-            # Retrieve relevant compliance info
-            retriever = self.vectorstore.as_retriever(search_kwargs={"k": 2})
-            relevant_docs = retriever.invoke(contract_text[:1000])
-            context = "\n".join([doc.page_content[:200] for doc in relevant_docs])
-            
-            # Single, focused prompt
-            prompt = f"""Analyze this contract for compliance issues ONLY.
-
-Compliance Standards:
-{context}
-
-Contract Text:
-{contract_text}
-
-Return ONLY valid JSON (no markdown, no extra text):
-{{"key_clauses": ["clause1", "clause2"], "compliance_issues": [{{"title": "Issue Title", "risk_level": "High/Medium/Low", "reason": "Brief reason"}}]}}"""
-            
-            # Single API call with careful error handling
-            result_text = self._call_groq_with_fallback(prompt, max_tokens=500)
-            
-            # Parse JSON from response
-            all_issues = []
-            all_clauses = []
+            prompt = self._build_analysis_prompt(contract_text)
+            responses = [self._call_groq_with_fallback(prompt, max_tokens=500, model=self.analysis_model)]
+            analysis_result = self._finish_analysis(responses, 1)
+            self._cache_analysis(cache_key, analysis_result)
+            return analysis_result
             
-            try:
-                json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group())
-                    all_clauses = result.get("key_clauses", [])[:10]  # Limit to 10
-                    all_issues = result.get("compliance_issues", [])[:8]  # Limit to 8
-            except json.JSONDecodeError:
-                pass
+        except Exception as e:
+            print(f"Error analyzing contract: {str(e)}")
+            return {"key_clauses": [], "compliance_issues": [], "error": str(e)}
+    
+    def analyze_contract_stream(self, contract_text) -> Iterator[Dict]:
+        """
+        Analyze a contract while reporting progress.
+        
+        Yields {"type": "token", "text": ...} as a short contract's analysis
+        is generated, {"type": "section", "done": n, "total": m} as sections
+        of a long contract finish, and finally {"type": "result", "result": {...}}.
+        """
+        if len(contract_text) > self.section_chars:
+            events = queue.Queue()
             
-            analysis_result = {
-                "key_clauses": all_clauses,
-                "compliance_issues": all_issues
-            }
+            def run():
+                try:
+                    result = self._run_async(self.aanalyze_contract(
+                        contract_text,
+                        on_section_done=lambda done, total: events.put({"type": "section", "done": done, "total": total})
+                    ))
+                except Exception as e:
+                    print(f"Error analyzing contract: {str(e)}")
+                    result = {"key_clauses": [], "compliance_issues": [], "error": str(e)}
+                events.put({"type": "result", "result": result})
             
-            return analysis_result
+            threading.Thread(target=run, daemon=True).start()
+            while True:
+                event = events.get()
+                yield event
+                if event["type"] == "result":
+                    return
+        
+        cache_key = self._analysis_cache_key(contract_text)
+        cached = self._get_cached_analysis(cache_key)
+        if cached is not None:
+            yield {"type": "result", "result": cached}
+            return
+        
+        try:
+            prompt = self._build_analysis_prompt(contract_text)
+            pieces = []
+            for piece in self._stream_groq_with_fallback(prompt, max_tokens=500, model=self.analysis_model):
+                pieces.append(piece)
+                yield {"type": "token", "text": piece}
             
+            responses = ["".join(pieces)]
+            analysis_result = self._finish_analysis(responses, 1)
+            self._cache_analysis(cache_key, analysis_result)
         except Exception as e:
             print(f"Error analyzing contract: {str(e)}")
-            return {"key_clauses": [], "compliance_issues": []}
+            analysis_result = {"key_clauses": [], "compliance_issues": [], "error": str(e)}
+        
+        yield {"type": "result", "result": analysis_result}
     
-    def get_chatbot_response(self, contract_text, user_question):
-        """Get chatbot response about contract - with caching"""
-        import hashlib
+    def _prepare_chat(self, contract_text, user_question) -> Dict:
+        """Resolve a chatbot question from cache, or build the prompt needed to answer it"""
+        contract_fp = contract_fingerprint(contract_text)
         
-        # Check cache first
-        cache_key = f"chat:{hashlib.md5((contract_text[:200] + user_question).encode()).hexdigest()}"
+        # Check exact cache first
+        question_key = re.sub(r'\s+', ' ', user_question).strip().lower()
+        cache_key = f"chat:{contract_fp}:{question_key}"
         cached_response = self.cache.get(cache_key)
         
         if cached_response:
-            return f"(cached) {cached_response}"
-        
-        # Retrieve relevant parts of the contract
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": 2})  # Reduced from 3 to 2
-        relevant_docs = retriever.invoke(user_question)
-        context = "\n".join([doc.page_content[:200] for doc in relevant_docs])  # Truncate
-        
-        # MINIMAL prompt for chatbot
-        prompt = f"""You are a compliance advisor. Answer briefly:
-Question: {user_question}
-Contract: {contract_text[:1000]}
-Standards: {context}
-Answer:"""
+            return {"cached": cached_response}
         
-        # Get response with fallback
-        response = self._call_groq_with_fallback(prompt, max_tokens=300)
+        # Then a paraphrase of an earlier question about the same contract
+        question_embedding = self.semantic_cache.embed(self._get_embeddings(), user_question)
+        cached_response = self.semantic_cache.lookup(contract_fp, user_question, question_embedding)
+        if cached_response:
+            return {"cached": cached_response}
+        
+        # Pack the question, the best-matching contract passages and standards into the budget
+        builder = PromptBuilder(self.token_counter, self._prompt_budget(300))
+        prompt = builder.build(
+            CHATBOT_PROMPT,
+            {
+                "question": [(user_question, 1.0)],
+                "standards": self._retrieve_standards(user_question),
+                "contract": self._retrieve_contract_passages(contract_text, user_question)
+            },
+            {"question": 200, "standards": self.standards_token_budget, "contract": None}
+        )
         
-        # Cache the response
-        self.cache.set(cache_key, response)
+        return {
+            "cached": None,
+            "prompt": prompt,
+            "cache_key": cache_key,
+            "contract_fp": contract_fp,
+            "question": user_question,
+            "question_embedding": question_embedding
+        }
+    
+    def _store_chat_response(self, chat: Dict, response: str):
+        """Cache a chatbot answer (never the rate-limit notice)"""
+        if response != RATE_LIMIT_MESSAGE:
+            self.cache.set(chat["cache_key"], response)
+            self.semantic_cache.add(chat["contract_fp"], chat["question"], chat["question_embedding"], chat["cache_key"])
+    
+    def get_chatbot_response(self, contract_text, user_question):
+        """Get chatbot response about contract - with exact and semantic caching"""
+        chat = self._prepare_chat(contract_text, user_question)
+        if chat["cached"]:
+            return f"(cached) {chat['cached']}"
+        
+        # Get response with fallback
+        response = self._call_groq_with_fallback(chat["prompt"], max_tokens=300)
+        self._store_chat_response(chat, response)
         
         return response
+    
+    def stream_chatbot_response(self, contract_text, user_question) -> Iterator[str]:
+        """Like get_chatbot_response, but yields the answer as it is generated"""
+        chat = self._prepare_chat(contract_text, user_question)
+        if chat["cached"]:
+            yield f"(cached) {chat['cached']}"
+            return
+        
+        pieces = []
+        for piece in self._stream_groq_with_fallback(chat["prompt"], max_tokens=300):
+            pieces.append(piece)
+            yield piece
+        
+        self._store_chat_response(chat, "".join(pieces))
@@ -0,0 +1,164 @@
+"""
+Rate Limiter - proactive token-bucket scheduling against Groq quotas
+
+Bucket state lives in SQLite so every Streamlit session and worker process
+on the machine draws from the same per-model quotas.
+"""
+import asyncio
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from utils.sqlite_helpers import ThreadConnections, immediate_transaction
+
+# Groq free-tier quotas: requests/tokens per minute and per day
+GROQ_LIMITS = {
+    "llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000, "rpd": 14400, "tpd": 500000},
+    "llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000, "rpd": 1000, "tpd": 100000},
+}
+DEFAULT_LIMITS = {"rpm": 30, "tpm": 6000, "rpd": 1000, "tpd": 100000}
+
+BUCKET_PERIODS = {"rpm": 60, "tpm": 60, "rpd": 86400, "tpd": 86400}
+DAILY_BUCKETS = ("rpd", "tpd")
+
+
+class TokenBucketLimiter:
+    """
+    Per-model token buckets for requests and tokens, per minute and per day.
+
+    Each bucket refills continuously at capacity/period. A call reserves one
+    request and its estimated tokens from all four buckets at once and is
+    told how long to wait before its reservation is covered.
+    """
+
+    def __init__(self, db_path: str = "rate_limits.db", limits: Optional[Dict] = None, safety_margin: float = 0.9):
+        self.db_path = db_path
+        self.limits = limits or GROQ_LIMITS
+        self.safety_margin = safety_margin  # Stay just under the published quota
+        self._db = ThreadConnections(db_path)
+        self._init_db()
+
+    def _init_db(self):
+        """Initialize bucket table"""
+        try:
+            self._db.get().execute('''CREATE TABLE IF NOT EXISTS buckets (
+                model TEXT,
+                bucket TEXT,
+                level REAL,
+                updated REAL,
+                PRIMARY KEY (model, bucket)
+            )''')
+        except Exception as e:
+            print(f"Rate limiter initialization error: {e}")
+
+    def _capacities(self, model: str) -> Dict[str, float]:
+        limits = self.limits.get(model, DEFAULT_LIMITS)
+        return {bucket: limits[bucket] * self.safety_margin for bucket in BUCKET_PERIODS}
+
+    def _refilled_levels(self, conn: sqlite3.Connection, model: str, now: float) -> Dict[str, float]:
+        """Current bucket levels after refilling for the time since the last update"""
+        capacities = self._capacities(model)
+        stored = {
+            row[0]: (row[1], row[2])
+            for row in conn.execute('SELECT bucket, level, updated FROM buckets WHERE model = ?', (model,))
+        }
+        levels = {}
+        for bucket, capacity in capacities.items():
+            level, updated = stored.get(bucket, (capacity, now))
+            rate = capacity / BUCKET_PERIODS[bucket]
+            levels[bucket] = min(capacity, level + max(0.0, now - updated) * rate)
+        return levels
+
+    def _store_levels(self, conn: sqlite3.Connection, model: str, levels: Dict[str, float], now: float):
+        conn.executemany(
+            'INSERT OR REPLACE INTO buckets (model, bucket, level, updated) VALUES (?, ?, ?, ?)',
+            [(model, bucket, level, now) for bucket, level in levels.items()]
+        )
+
+    def reserve(self, model: str, tokens: int, max_wait: Optional[float] = None,
+                max_daily_wait: Optional[float] = None) -> Optional[float]:
+        """
+        Reserve one request and `tokens` tokens for model, queueing behind earlier reservations.
+
+        Buckets may go into debt, so every reservation is taken immediately
+        and later callers are told to wait longer: waiters are served in the
+        order they arrived, across threads and processes. max_daily_wait
+        caps the wait on the daily buckets alone, so a caller that may queue
+        through the per-minute quotas still never books hours of debt
+        against an exhausted daily quota.
+
+        Returns:
+            Seconds to wait before sending the request, or None (nothing
+            reserved) if that would be longer than max_wait, or the daily
+            buckets' share of it longer than max_daily_wait
+        """
+        capacities = self._capacities(model)
+        costs = {"rpm": 1, "rpd": 1, "tpm": tokens, "tpd": tokens}
+        conn = self._db.get()
+        now = time.time()
+
+        with immediate_transaction(conn):
+            levels = self._refilled_levels(conn, model, now)
+
+            waits = {}
+            for bucket, cost in costs.items():
+                # A request larger than a bucket can ever hold just needs the bucket full
+                cost = min(cost, capacities[bucket])
+                rate = capacities[bucket] / BUCKET_PERIODS[bucket]
+                waits[bucket] = max(0.0, (cost - levels[bucket]) / rate)
+            wait = max(waits.values())
+            daily_wait = max(waits[bucket] for bucket in DAILY_BUCKETS)
+
+            if (max_wait is not None and wait > max_wait) or \
+                    (max_daily_wait is not None and daily_wait > max_daily_wait):
+                wait = None
+            else:
+                for bucket, cost in costs.items():
+                    levels[bucket] -= min(cost, capacities[bucket])
+                self._store_levels(conn, model, levels, now)
+        return wait
+
+    def acquire(self, model: str, tokens: int, max_wait: Optional[float] = None,
+                max_daily_wait: Optional[float] = None) -> bool:
+        """Block until the reservation is due; False (nothing reserved) if it would take longer than allowed"""
+        wait = self.reserve(model, tokens, max_wait, max_daily_wait)
+        if wait is None:
+            return False
+        time.sleep(wait)
+        return True
+
+    async def aacquire(self, model: str, tokens: int, max_wait: Optional[float] = None,
+                       max_daily_wait: Optional[float] = None) -> bool:
+        """Async variant of acquire() that sleeps without blocking the event loop"""
+        wait = await asyncio.to_thread(self.reserve, model, tokens, max_wait, max_daily_wait)
+        if wait is None:
+            return False
+        await asyncio.sleep(wait)
+        return True
+
+    def reconcile(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """Correct the token buckets once the response reports real usage"""
+        delta = estimated_tokens - actual_tokens
+        if delta == 0:
+            return
+        self._adjust(model, {"tpm": delta, "tpd": delta})
+
+    def penalize(self, model: str):
+        """Drain the per-minute buckets after an unexpected 429 (quota shared with other clients)"""
+        capacities = self._capacities(model)
+        self._adjust(model, {"rpm": -capacities["rpm"], "tpm": -capacities["tpm"]}, floor=0.0)
+
+    def _adjust(self, model: str, deltas: Dict[str, float], floor: Optional[float] = None):
+        capacities = self._capacities(model)
+        conn = self._db.get()
+        now = time.time()
+        try:
+            with immediate_transaction(conn):
+                levels = self._refilled_levels(conn, model, now)
+                for bucket, delta in deltas.items():
+                    level = min(capacities[bucket], levels[bucket] + delta)
+                    # The floor never forgives debt owed by queued reservations
+                    levels[bucket] = level if floor is None else max(min(floor, levels[bucket]), level)
+                self._store_levels(conn, model, levels, now)
+        except Exception as e:
+            print(f"Rate limiter update error: {e}")
@@ -0,0 +1,51 @@
+"""
+SQLite helpers shared by the job queue, rate limiter and embedding store
+
+Each of those is used from several threads and several processes at once,
+so they keep one connection per thread in autocommit mode and wrap every
+read-modify-write in BEGIN IMMEDIATE.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, Sequence
+
+
+class ThreadConnections:
+    """One connection per thread to a database; transactions are managed explicitly"""
+
+    def __init__(self, db_path: str, row_factory: Optional[type] = None, pragmas: Sequence[str] = ()):
+        self.db_path = db_path
+        self.row_factory = row_factory
+        self.pragmas = tuple(pragmas)
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            for pragma in self.pragmas:
+                conn.execute(f'PRAGMA {pragma}')
+            self._local.conn = conn
+        return conn
+
+
+@contextmanager
+def immediate_transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """
+    BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises.
+
+    Taking the write lock up front serialises read-modify-write sequences
+    across processes instead of failing one of them on upgrade.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
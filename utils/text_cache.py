@@ -0,0 +1,152 @@
+"""
+Text Cache - extracted PDF text on disk, so each PDF version is parsed once
+
+Shared by regulatory_update_tracket.py and utils/rag_helper.py. Pages are
+stored as JSON lines under the file's SHA-256, and a small index maps each
+path to the (size, mtime) it had when it was last hashed, so unchanged
+files are not even re-hashed.
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from utils.pdf_text import iter_pdf_pages
+from utils.vector_index import file_sha256
+
+TEXT_CACHE_DIR = os.path.join("data", "text_cache")
+INDEX_FILE = "index.json"
+
+
+def _atomic_write(path: str, write):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class ExtractedTextCache:
+    """
+    Disk-backed cache of per-page PDF text keyed by file hash.
+
+    A file whose size and mtime still match its index entry reuses the
+    stored hash; otherwise it is re-hashed, so a touched-but-identical file
+    still hits and an edited one never does.
+    """
+
+    def __init__(self, cache_dir: str = TEXT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._load_index()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _pages_path(self, sha: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha}.jsonl")
+
+    def file_hash(self, path: str) -> str:
+        """SHA-256 of the file, re-computed only when its size or mtime changed"""
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+
+        sha = file_sha256(path)
+        with self._lock:
+            # Re-read first so entries written by other processes are kept
+            self._index = {**self._load_index(), **self._index}
+            self._index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha}
+            index = dict(self._index)
+        try:
+            _atomic_write(self._index_path(), lambda f: json.dump(index, f))
+        except OSError as e:
+            print(f"Text cache index write error: {e}")
+        return sha
+
+    def iter_pages(self, path: str, workers: Optional[int] = None) -> Iterator[str]:
+        """
+        Stream page texts for a PDF, one page in memory at a time.
+
+        A hit reads the JSON lines back lazily. A miss extracts and writes
+        through page by page; the cache entry only appears once the whole
+        document has been read, so an abandoned stream leaves nothing behind.
+        """
+        pages_path = self._pages_path(self.file_hash(path))
+        if os.path.exists(pages_path):
+            # Entries are renamed into place whole, so a present file is complete
+            with open(pages_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+            return
+
+        tmp_path = f"{pages_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        completed = False
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for page in iter_pdf_pages(path, workers=workers):
+                    f.write(json.dumps(page) + "\n")
+                    yield page
+            os.replace(tmp_path, pages_path)
+            completed = True
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_pages(self, path: str, workers: Optional[int] = None) -> List[str]:
+        """Page texts for a PDF, extracting (and caching) them on a miss"""
+        return list(self.iter_pages(path, workers=workers))
+
+    def clear(self):
+        """Remove every cached extraction"""
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                os.remove(os.path.join(self.cache_dir, name))
+            self._index = {}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_text_cache() -> ExtractedTextCache:
+    """Return the process-wide extracted-text cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractedTextCache()
+        return _cache
+
+
+def read_pdf_pages(path: str, workers: Optional[int] = None) -> List[str]:
+    """Page texts for a PDF, parsed at most once per file version"""
+    return get_text_cache().get_pages(path, workers=workers)
+
+
+def stream_pdf_pages(path: str, workers: Optional[int] = None) -> Iterator[str]:
+    """Page texts for a PDF as a stream, parsed at most once per file version"""
+    return get_text_cache().iter_pages(path, workers=workers)
+
+
+def load_contract_text(contract_path: str, workers: Optional[int] = None) -> str:
+    """
+    Load contract text from a PDF or text file.
+
+    Lives here rather than in rag_helper so process pools can run it
+    without their workers importing LangChain.
+    """
+    if contract_path.lower().endswith(".pdf"):
+        # Parsed once per file version; large PDFs are extracted page-parallel, workers=1 keeps it serial
+        return " ".join(read_pdf_pages(contract_path, workers=workers))
+    with open(contract_path) as f:
+        return f.read()
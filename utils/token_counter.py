@@ -0,0 +1,114 @@
+"""
+Token Counter - tokenizer-backed prompt accounting and usage tracking
+"""
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Llama 3's tokenizer is a tiktoken BPE that extends cl100k_base, so counts
+# from cl100k_base are close to what Groq bills for the Llama models.
+DEFAULT_ENCODING = "cl100k_base"
+
+_fallback_warned = False
+_fallback_lock = threading.Lock()
+
+
+def _load_encoding(encoding_name: str):
+    """
+    The tiktoken encoding, or None if it is unavailable.
+
+    get_encoding downloads the BPE file on first use, so an offline host
+    fails here too. Either way counting falls back to the heuristic, and
+    the first fallback in a process says so.
+    """
+    global _fallback_warned
+    if tiktoken is None:
+        reason = "tiktoken is not installed (pip install tiktoken)"
+    else:
+        try:
+            return tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            reason = f"the {encoding_name} encoding could not be loaded: {e}"
+    with _fallback_lock:
+        if not _fallback_warned:
+            _fallback_warned = True
+            print(f"⚠️ Token counts are estimated at 4 characters per token, {reason}")
+    return None
+
+
+class TokenCounter:
+    """
+    Counts tokens with a real BPE tokenizer and records actual API usage.
+
+    Counts for repeated text (retrieved standards, contract sections) are
+    served from an LRU cache. Falls back to the 4-characters-per-token
+    heuristic, with a warning, if tiktoken or its encoding is unavailable.
+    """
+
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, cache_size: int = 4096, history_size: int = 500):
+        self.encoding = _load_encoding(encoding_name)
+        self._count_cached = lru_cache(maxsize=cache_size)(self._count_uncached)
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history_size)
+        self._totals = {}
+
+    @property
+    def is_exact(self) -> bool:
+        """True when a real tokenizer backs the counts"""
+        return self.encoding is not None
+
+    def _count_uncached(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+        if not text:
+            return 0
+        return self._count_cached(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is None:
+            return text[:max_tokens * 4]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:max_tokens])
+
+    def record_usage(self, model: str, usage) -> Dict:
+        """Record the usage block of a Groq response"""
+        entry = {
+            "timestamp": int(time.time()),
+            "model": model,
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        }
+        with self._lock:
+            self._history.append(entry)
+            totals = self._totals.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+            totals["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                totals[key] += entry[key]
+        return entry
+
+    def usage_summary(self) -> Dict[str, Dict]:
+        """Per-model totals of recorded calls"""
+        with self._lock:
+            return {model: dict(totals) for model, totals in self._totals.items()}
+
+    def recent_usage(self, limit: int = 20) -> List[Dict]:
+        """Most recent recorded calls, newest last"""
+        with self._lock:
+            return list(self._history)[-limit:]
@@ -0,0 +1,143 @@
+"""
+Vector index helpers - manifest bookkeeping and incremental sync for the persisted FAISS index
+"""
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file's contents without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(source_path: str, chunk_size: int, chunk_overlap: int, embedding_model: str) -> Dict:
+    """Describe everything the index contents depend on"""
+    return build_source_manifest(file_sha256(source_path), chunk_size, chunk_overlap, embedding_model)
+
+
+def build_source_manifest(source_sha256: str, chunk_size: int, chunk_overlap: int, embedding_model: str) -> Dict:
+    """Manifest for a source identified by an already computed content hash"""
+    return {
+        "version": MANIFEST_VERSION,
+        "source_sha256": source_sha256,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding_model": embedding_model,
+    }
+
+
+def read_manifest(index_path: str) -> Optional[Dict]:
+    """Read the manifest stored next to a FAISS index, if any"""
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(index_path: str, manifest: Dict):
+    """Atomically write the manifest so a crash never leaves a half-written file"""
+    os.makedirs(index_path, exist_ok=True)
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def manifest_matches(stored: Optional[Dict], expected: Dict) -> bool:
+    """True when a stored manifest describes the same source, chunker and model"""
+    if not stored:
+        return False
+    keys = ("version", "source_sha256", "chunk_size", "chunk_overlap", "embedding_model")
+    return all(stored.get(k) == expected.get(k) for k in keys)
+
+
+def index_version(manifest: Optional[Dict]) -> str:
+    """Short stable identifier for the index contents a manifest describes"""
+    if not manifest:
+        return "none"
+    payload = json.dumps(manifest, sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def chunk_id(text: str) -> str:
+    """Content-derived id so an unchanged chunk keeps its id across rebuilds"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(chunks) -> Tuple[List, List[str]]:
+    """Give every chunk a content id, dropping exact duplicates"""
+    unique_chunks, ids, seen = [], [], set()
+    for chunk in chunks:
+        cid = chunk_id(chunk.page_content)
+        if cid in seen:
+            continue
+        seen.add(cid)
+        unique_chunks.append(chunk)
+        ids.append(cid)
+    return unique_chunks, ids
+
+
+def can_update_incrementally(stored: Optional[Dict], expected: Dict) -> bool:
+    """Only the source may differ; a new chunker or model invalidates every vector"""
+    if not stored or not stored.get("chunk_ids"):
+        return False
+    keys = ("version", "chunk_size", "chunk_overlap", "embedding_model")
+    return all(stored.get(k) == expected.get(k) for k in keys)
+
+
+def sync_faiss_index(index_path: str, chunks, embeddings, manifest: Dict):
+    """
+    Bring the FAISS index at index_path in line with chunks.
+    
+    Loads the index untouched when the manifest matches, embeds only
+    new chunks and deletes vanished ones when just the source changed,
+    and falls back to a full build otherwise.
+    
+    Returns:
+        Tuple of (vectorstore, stats) where stats has mode/added/removed
+    """
+    # Imported here so file_sha256 and the manifest helpers stay LangChain-free
+    from langchain_community.vectorstores import FAISS
+    
+    stored = read_manifest(index_path) if os.path.exists(index_path) else None
+    
+    if manifest_matches(stored, manifest):
+        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        return vectorstore, {"mode": "loaded", "added": 0, "removed": 0}
+    
+    unique_chunks, ids = assign_chunk_ids(chunks)
+    
+    if can_update_incrementally(stored, manifest):
+        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+        old_ids = set(stored["chunk_ids"])
+        new_ids = set(ids)
+        
+        removed = [cid for cid in stored["chunk_ids"] if cid not in new_ids]
+        added = [(chunk, cid) for chunk, cid in zip(unique_chunks, ids) if cid not in old_ids]
+        
+        if removed:
+            vectorstore.delete(removed)
+        if added:
+            vectorstore.add_documents([c for c, _ in added], ids=[cid for _, cid in added])
+        stats = {"mode": "incremental", "added": len(added), "removed": len(removed)}
+    else:
+        vectorstore = FAISS.from_documents(unique_chunks, embeddings, ids=ids)
+        stats = {"mode": "full", "added": len(ids), "removed": 0}
+    
+    vectorstore.save_local(index_path)
+    write_manifest(index_path, dict(manifest, chunk_ids=ids))
+    return vectorstore, stats